@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +82,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # keep connections, and the INVENTORY_SQLITE_PRAGMAS set on them, between requests
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # seconds the driver waits for a lock before "database is locked"
+            'timeout': 20,
+        },
+        # tests run on a file, as the server does: the in-memory test database
+        # shares its cache between connections and never waits for a lock
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
+    },
+    # sales older than INVENTORY_ARCHIVE_AFTER_DAYS, moved by archive_sales
+    'archive': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'archive.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['inventory.routers.ArchiveRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'inventory',
     }
 }
 
@@ -119,6 +152,8 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
         'rest_framework.parsers.FormParser',
@@ -168,6 +203,95 @@ SWAGGER_SETTINGS = {
 }
 
 
+# Inventory
+# Sales committed per transaction by the bulk sale endpoint, clients may ask
+# for a different chunk size up to the maximum
+INVENTORY_BULK_SALE_CHUNK_SIZE = 500
+INVENTORY_BULK_SALE_MAX_CHUNK_SIZE = 5000
+
+# Most stock counts the receiving endpoint applies in its one transaction
+INVENTORY_RECEIVING_MAX_ITEMS = 10000
+
+# Admin changelists of tables larger than this show an estimated row count
+# instead of running COUNT(*) over the table
+INVENTORY_ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Upper bound for the `page_size` query parameter of list endpoints
+INVENTORY_MAX_PAGE_SIZE = 1000
+
+# Cache holding the per-store inventory snapshots and their lifetime in seconds.
+# A sale drops the snapshots of its store in the cache of the process that
+# recorded it: with the local memory cache and more than one server process the
+# other processes keep serving theirs until the timeout, so keep it short or
+# point this to a cache every process shares (memcached, a database cache)
+INVENTORY_SNAPSHOT_CACHE = 'default'
+INVENTORY_SNAPSHOT_TIMEOUT = 30
+
+# Responses of sales sent with an Idempotency-Key header are kept this many
+# seconds, retries with the same key get the original response back
+INVENTORY_IDEMPOTENCY_CACHE = 'default'
+INVENTORY_IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+
+# Inventory rows without a reorder point are low on stock at or below this quantity
+INVENTORY_LOW_STOCK_THRESHOLD = 5
+
+# In-process product and store cache used to validate sales, entries per
+# model and seconds before an entry is read again from the database
+INVENTORY_CATALOG_SIZE = 50000
+INVENTORY_CATALOG_TIMEOUT = 300
+
+# Per endpoint request, latency and SQL metrics served at /metrics, with a
+# Server-Timing header on every response. Off, the middleware is not loaded
+INVENTORY_METRICS_ENABLED = True
+# /metrics is not behind the API authentication, it answers the scrapers on
+# these addresses or sending `Authorization: Bearer <token>` with this token
+INVENTORY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+INVENTORY_METRICS_TOKEN = os.environ.get('INVENTORY_METRICS_TOKEN')
+
+# Queue every valid sale for the process_sales worker and answer 202 with a
+# ticket; clients can still pick per request with `Prefer: respond-async` or
+# `Prefer: respond-sync`. The worker records this many queued sales per transaction
+INVENTORY_ASYNC_SALES = False
+INVENTORY_OUTBOX_BATCH_SIZE = 500
+
+# Sales only append pending stock movements instead of rewriting the
+# inventory row, compact_stock folds them into Inventory.available. The row
+# is still locked to check the stock, so it is not faster. Run compact_stock
+# before turning it off again
+INVENTORY_STOCK_DEFERRED = False
+
+# Database alias archive_sales moves old sales to, sales stay in the default
+# database when the alias is not configured
+INVENTORY_ARCHIVE_DATABASE = 'archive'
+
+# Sales older than this many days are archived, in batches of this many sales
+INVENTORY_ARCHIVE_AFTER_DAYS = 365
+INVENTORY_ARCHIVE_BATCH_SIZE = 500
+
+# Product and store searches matching more rows than this are ordered by id
+# instead of relevance, ranking every match would cost more than the search
+INVENTORY_SEARCH_RANK_LIMIT = 2000
+
+# Loggers whose handlers run on a background thread behind a queue holding up
+# to INVENTORY_LOG_QUEUE_SIZE records (0 is unbounded, a full queue drops
+# records), and the fraction of the per sale line debug events that is kept
+INVENTORY_ASYNC_LOGGERS = ['inventory']
+INVENTORY_LOG_QUEUE_SIZE = 10000
+INVENTORY_LOG_SAMPLE_RATE = 0.01
+
+# Run on every new SQLite connection. WAL lets readers work while a sale is
+# written, NORMAL synchronous is durable in WAL mode except on power loss,
+# busy_timeout (ms) waits for the write lock instead of failing, cache_size
+# is in KiB when negative and mmap_size in bytes
+INVENTORY_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -182,10 +306,12 @@ LOGGING = {
     },
     'formatters': {
         'verbose': {
+            '()': 'inventory.logs.StructuredFormatter',
             'format': "[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s",
             'datefmt': "%d/%b/%Y %H:%M:%S"
         },
         'simple': {
+            '()': 'inventory.logs.StructuredFormatter',
             'format': '%(levelname)s %(message)s'
         },
     },
@@ -201,6 +327,7 @@ LOGGING = {
             'level': 'DEBUG',
             'class': 'logging.StreamHandler',
             'stream': sys.stdout,
+            'formatter': 'simple',
         },
     },
     'loggers': {
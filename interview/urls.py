@@ -17,9 +17,12 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
 
+from inventory.metrics import metrics
+
 urlpatterns = [
     path(r'admin/', admin.site.urls),
     path(r'', include('swagger.urls')),
     path(r'v1/api/', include('inventory.urls')),
+    path(r'metrics', metrics, name='metrics'),
     url(r'^api-auth/', include('rest_framework.urls'))
 ]
@@ -1,11 +1,52 @@
 from django.contrib import admin
+from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 
+from . import search
 from .models import Store, Product, Sale, SaleDetail, Inventory
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist for tables of millions of rows: the size of the unfiltered list
+    is estimated, a filtered list is not counted twice, and the search only
+    takes indexed paths. `name_search` fields ('name', 'product__name') are
+    matched through the FTS5 name indexes and `exact_search` fields compared
+    whole, on their index. Without the name indexes `search_fields` is used.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    name_search = ()
+    exact_search = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        indexes = [self.name_index(field) for field in self.name_search]
+        if not search.match_query([search_term]) or not (indexes or self.exact_search) \
+                or not all(search.available(model) for relation, model in indexes):
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q()
+        for field in self.exact_search:
+            condition |= Q(**{field: search_term})
+        for relation, model in indexes:
+            matches = search.matching(model._default_manager.all(), [search_term]).values('id')
+            condition |= Q(**{f'{relation}__in': matches})
+        return queryset.filter(condition), False
+
+    def name_index(self, field):
+        """
+        (relation, model) holding the name of a `name_search` field
+        """
+        path = field.split('__')[:-1]
+        model = self.model
+        for name in path:
+            model = model._meta.get_field(name).related_model
+        return '__'.join(path) or 'pk', model
 
 
 @admin.register(Store)
-class StoreAdmin(admin.ModelAdmin):
+class StoreAdmin(LargeTableAdmin):
     fieldsets = (
         (_('basic data'), {
             'fields': ('name',)
@@ -15,11 +56,13 @@ class StoreAdmin(admin.ModelAdmin):
         }),
     )
     list_display = ('name', 'address',)
+    search_fields = ('^name',)
+    name_search = ('name',)
     exclude = ('date_lst',)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     fieldsets = (
         (_('basic data'), {
             'fields': ('name',)
@@ -29,19 +72,26 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
     list_display = ('name', 'unit', 'price',)
-    search_fields = ('unit',)
+    list_filter = ('unit',)
+    search_fields = ('^name',)
+    name_search = ('name',)
     exclude = ('date_lst',)
 
 
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
+class SaleAdmin(LargeTableAdmin):
     fields = ('number', 'store',)
-    search_fields = fields
+    list_display = ('number', 'store', 'date',)
+    list_select_related = ('store',)
+    autocomplete_fields = ('store',)
+    search_fields = ('=number', '^store__name',)
+    exact_search = ('number',)
+    name_search = ('store__name',)
     exclude = ('date_lst',)
 
 
 @admin.register(SaleDetail)
-class SaleDetailAdmin(admin.ModelAdmin):
+class SaleDetailAdmin(LargeTableAdmin):
     fieldsets = (
         (_('sale information'), {
             'fields': ('sale',)
@@ -51,20 +101,29 @@ class SaleDetailAdmin(admin.ModelAdmin):
         }),
     )
     list_display = ('sale', 'product', 'quantity',)
-    search_fields = ('product', 'sale',)
+    list_select_related = ('sale', 'product',)
+    autocomplete_fields = ('sale', 'product',)
+    search_fields = ('=sale__number', '^product__name',)
+    exact_search = ('sale__number',)
+    name_search = ('product__name',)
+    # the model orders by product name, a sort over the whole table
+    ordering = ('-id',)
     exclude = ('date_lst',)
 
 
 @admin.register(Inventory)
-class InventoryAdmin(admin.ModelAdmin):
+class InventoryAdmin(LargeTableAdmin):
     fieldsets = (
         (_('location'), {
             'fields': ('store',)
         }),
         (_('inventory'), {
-            'fields': ('product', 'available',)
+            'fields': ('product', 'available', 'reorder_point',)
         }),
     )
     list_display = ('store', 'product', 'available',)
-    search_fields = ('store', 'product',)
+    list_select_related = ('store', 'product',)
+    autocomplete_fields = ('store', 'product',)
+    search_fields = ('^store__name', '^product__name',)
+    name_search = ('store__name', 'product__name',)
     exclude = ('date_lst',)
@@ -0,0 +1,113 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Prefetch
+
+from .models import ArchivedSale, ArchivedSaleDetail, Sale, SaleDetail
+from .routers import archive_database
+from .stock import write_lock
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def horizon(days=None):
+    """
+    Date before which sales are archived, INVENTORY_ARCHIVE_AFTER_DAYS ago by default
+    """
+    if days is None:
+        days = settings.INVENTORY_ARCHIVE_AFTER_DAYS
+    return datetime.date.today() - datetime.timedelta(days=days)
+
+
+def archive_sales(before, batch_size):
+    """
+    Move the sales dated before `before` and their details to the archive
+    database, `batch_size` sales per batch, oldest ids first. Returns the
+    number of sales moved.
+
+    Each batch is committed in the archive before it is deleted here, so a
+    crash in between leaves the batch in both databases and the next run,
+    which skips the rows already copied, completes the move. Sales keep their
+    id, stock movements keep pointing to them.
+    """
+    archive = archive_database()
+    if archive == 'default':
+        return 0
+    moved = 0
+    while True:
+        with transaction.atomic():
+            # the batch is read before it is deleted
+            write_lock()
+            sales = list(Sale.objects.filter(date__lt=before).order_by('id')
+                         .values_list('id', 'number', 'store_id', 'date')[:batch_size])
+            if not sales:
+                return moved
+            ids = [sale[0] for sale in sales]
+            details = SaleDetail.objects.filter(sale_id__in=ids).order_by('id') \
+                .values_list('id', 'sale_id', 'product_id', 'quantity', 'value', 'date_lst')
+            with transaction.atomic(using=archive):
+                ArchivedSale.objects.bulk_create([
+                    ArchivedSale(id=sale_id, number=number, store_id=store_id, date=date)
+                    for sale_id, number, store_id, date in sales
+                ], ignore_conflicts=True)
+                ArchivedSaleDetail.objects.bulk_create([
+                    ArchivedSaleDetail(id=detail_id, sale_id=sale_id, product_id=product_id, quantity=quantity,
+                                       value=value, date_lst=date_lst)
+                    for detail_id, sale_id, product_id, quantity, value, date_lst in details
+                ], ignore_conflicts=True)
+            # details cascade, queued sales referencing them are unlinked
+            Sale.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+        logger.info('archived %s sales up to id %s', moved, ids[-1])
+
+
+def newest_date():
+    """
+    Date of the newest archived sale, read on its index, None when nothing
+    is archived
+    """
+    if archive_database() == 'default':
+        return None
+    return ArchivedSale.objects.aggregate(newest=Max('date'))['newest']
+
+
+def reaches_archive(date_from):
+    """
+    Whether sales dated from `date_from` on may be in the archive
+    """
+    newest = newest_date()
+    return newest is not None and (date_from is None or date_from <= newest)
+
+
+def history(store=None, date_from=None, date_to=None, before=None, limit=100):
+    """
+    Sales of both databases, newest id first, at most `limit` of them with
+    an id below `before`, filtered by `store` and an inclusive date range.
+    The archive is only read when the range reaches into it.
+    """
+    def select(queryset, details):
+        if store is not None:
+            queryset = queryset.filter(store_id=store)
+        if date_from is not None:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to is not None:
+            queryset = queryset.filter(date__lte=date_to)
+        if before is not None:
+            queryset = queryset.filter(id__lt=before)
+        return list(queryset.order_by('-id').prefetch_related(
+            Prefetch('saledetail_set', queryset=details.order_by('id'))
+        )[:limit])
+
+    sales = select(Sale.objects.all(), SaleDetail.objects.all())
+    if reaches_archive(date_from):
+        sales += select(ArchivedSale.objects.all(), ArchivedSaleDetail.objects.all())
+        sales.sort(key=lambda sale: sale.id, reverse=True)
+    return sales[:limit]
+
+
+def archived_sale(sale_id):
+    if archive_database() == 'default':
+        return None
+    return ArchivedSale.objects.prefetch_related('saledetail_set').filter(id=sale_id).first()
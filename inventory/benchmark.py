@@ -0,0 +1,189 @@
+import datetime
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from . import rollups
+from .metrics import QueryTimer
+from .models import Store, Product, Inventory, Sale, SaleDetail
+
+# endpoints driven by a run, in the order they are measured
+SCENARIOS = ('sale-create', 'inventory-list', 'sale-list', 'sale-detail-list', 'mixed', 'mixed-write')
+# the mixed scenario sends one sale for every three reads
+MIXED = ('sale-create', 'inventory-list', 'sale-list', 'inventory-list')
+# every writer reading the stock before it writes: single sales, bulk uploads and stock receipts
+MIXED_WRITE = ('sale-create', 'sale-bulk', 'inventory-receive')
+
+
+def seed(stores, products, sales, lines=3, seed=0):
+    """
+    Fill an empty database with `stores` x `products` inventory rows and
+    `sales` historical sales of `lines` lines each, spread over the last 90
+    days. Returns the data the scenarios pick their requests from.
+    """
+    rng = random.Random(seed)
+    Store.objects.bulk_create([Store(name=f'store {i}') for i in range(stores)])
+    Product.objects.bulk_create([
+        Product(name=f'product {i}', unit=Product.UNIT_UNITY, price=Decimal(rng.randint(100, 10000)) / 100)
+        for i in range(products)
+    ])
+    store_ids = list(Store.objects.order_by('id').values_list('id', flat=True))
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    Inventory.objects.bulk_create([
+        Inventory(store_id=store_id, product_id=product_id, available=10 ** 6)
+        for store_id in store_ids
+        for product_id in product_ids
+    ])
+
+    today = datetime.date.today()
+    Sale.objects.bulk_create([
+        Sale(number=f'h{i}', store_id=rng.choice(store_ids), date=today - datetime.timedelta(days=rng.randrange(90)))
+        for i in range(sales)
+    ])
+    SaleDetail.objects.bulk_create([
+        SaleDetail(sale_id=sale_id, product_id=product_id, quantity=rng.randint(1, 5), value=Decimal('10.00'))
+        for sale_id in Sale.objects.values_list('id', flat=True)
+        for product_id in rng.sample(product_ids, min(lines, len(product_ids)))
+    ])
+    rollups.rebuild()
+
+    user, _ = User.objects.get_or_create(username='benchmark', defaults={'is_superuser': True, 'is_staff': True})
+    return {'user': user, 'stores': store_ids, 'products': product_ids}
+
+
+def request(client, scenario, data, number, rng, prefix='b'):
+    if scenario == 'mixed':
+        return request(client, MIXED[number % len(MIXED)], data, number, rng, prefix='m')
+    if scenario == 'mixed-write':
+        return request(client, MIXED_WRITE[number % len(MIXED_WRITE)], data, number, rng, prefix='w')
+    if scenario == 'sale-bulk':
+        return client.post('/v1/api/sale/bulk/', [
+            {
+                'number': f'{prefix}{number}-{i}',
+                'store': rng.choice(data['stores']),
+                'details': [{'product_id': product_id, 'quantity': 1} for product_id in rng.sample(data['products'], 1)]
+            }
+            for i in range(5)
+        ], format='json')
+    if scenario == 'inventory-receive':
+        return client.post('/v1/api/inventory/receive/', [
+            {'store': rng.choice(data['stores']), 'product': product_id, 'quantity': rng.randint(1, 20)}
+            for product_id in rng.sample(data['products'], min(5, len(data['products'])))
+        ], format='json')
+    if scenario == 'sale-create':
+        return client.post('/v1/api/sale/', {
+            'number': f'{prefix}{number}',
+            'store': rng.choice(data['stores']),
+            'details': [
+                {'product_id': product_id, 'quantity': rng.randint(1, 5)}
+                for product_id in rng.sample(data['products'], min(rng.randint(1, 5), len(data['products'])))
+            ]
+        }, format='json')
+    if scenario == 'inventory-list':
+        return client.get(f'/v1/api/inventory/?store={rng.choice(data["stores"])}&flat=1')
+    if scenario == 'sale-list':
+        return client.get('/v1/api/sale/')
+    return client.get('/v1/api/sale-detail/')
+
+
+def run_scenario(scenario, data, requests, concurrency=1, seed=0):
+    """
+    Send `requests` requests of a scenario from `concurrency` threads, each
+    with its own client and database connection, and summarise them
+    """
+    numbers = iter(range(requests))
+    lock = threading.Lock()
+    samples = []
+
+    def worker(index):
+        client = APIClient()
+        client.force_authenticate(data['user'])
+        rng = random.Random(f'{seed}:{scenario}:{index}')
+        timer = QueryTimer()
+        try:
+            with connection.execute_wrapper(timer):
+                while True:
+                    with lock:
+                        number = next(numbers, None)
+                    if number is None:
+                        return
+                    queries = timer.queries
+                    started = time.perf_counter()
+                    try:
+                        ok = request(client, scenario, data, number, rng).status_code < 400
+                    except Exception:
+                        # the test client raises the server errors, e.g. "database is locked"
+                        ok = False
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        samples.append((elapsed, timer.queries - queries, ok))
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarise(samples, time.perf_counter() - started)
+
+
+def summarise(samples, seconds):
+    latencies = sorted(sample[0] for sample in samples)
+    count = len(samples)
+    return {
+        'requests': count,
+        'errors': sum(1 for sample in samples if not sample[2]),
+        'throughput': round(count / seconds, 2) if seconds else 0.0,
+        'p50': round(percentile(latencies, 50) * 1000, 3),
+        'p95': round(percentile(latencies, 95) * 1000, 3),
+        'p99': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_request': round(sum(sample[1] for sample in samples) / count, 2) if count else 0.0,
+    }
+
+
+def percentile(values, rank):
+    """
+    Nearest rank percentile of sorted values
+    """
+    if not values:
+        return 0.0
+    return values[max(0, -(-rank * len(values) // 100) - 1)]
+
+
+def run(data, requests, concurrency=1, scenarios=SCENARIOS, seed=0):
+    return {scenario: run_scenario(scenario, data, requests, concurrency, seed) for scenario in scenarios}
+
+
+def regressions(baseline, report, threshold):
+    """
+    Compare a report with a saved baseline. Latencies may grow and
+    throughput may drop by `threshold` (0.2 is 20%), queries per request may
+    not grow at all and errors are always a regression.
+    """
+    found = []
+    for scenario, current in report['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(scenario)
+        if expected is None:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            if current[metric] > expected[metric] * (1 + threshold):
+                found.append(f'{scenario}: {metric} {current[metric]}ms, baseline {expected[metric]}ms')
+        if current['throughput'] < expected['throughput'] * (1 - threshold):
+            found.append(f'{scenario}: throughput {current["throughput"]}/s, baseline {expected["throughput"]}/s')
+        if current['queries_per_request'] > expected['queries_per_request']:
+            found.append(f'{scenario}: {current["queries_per_request"]} queries per request, '
+                         f'baseline {expected["queries_per_request"]}')
+        if current['errors'] > expected['errors']:
+            found.append(f'{scenario}: {current["errors"]} errors, baseline {expected["errors"]}')
+    return found
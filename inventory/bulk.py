@@ -0,0 +1,282 @@
+import datetime
+from itertools import islice
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import ValidationError
+
+from . import catalog, ledger, rollups
+from .models import Sale, SaleDetail
+from .serializers import QUANTITY_MAX, line_value, shortage_errors
+from .stock import InsufficientStock, aggregate, lock_rows, shortages, write_lock
+from .upserts import insert_sql
+
+import logging
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+REJECTED = 'rejected'
+DUPLICATE = 'duplicate'
+
+NUMBER_MAX_LENGTH = Sale._meta.get_field('number').max_length
+# one field for every line, building it per line is measurable in a large upload
+LINE_VALUE = line_value()
+
+
+def ingest_sales(items, chunk_size):
+    """
+    Create sales from an iterable of sale payloads, committing every
+    `chunk_size` payloads in its own transaction. Returns one result per
+    payload, in input order.
+    """
+    results = []
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return results
+        results.extend(ingest_chunk(chunk, offset=len(results)))
+
+
+def ingest_chunk(items, offset=0):
+    stores, products = load_catalog(items)
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        sale, errors = parse_sale(item, stores, products)
+        if errors:
+            results[index] = rejected(offset + index, item, errors)
+        else:
+            parsed.append((index, sale))
+    valid = skip_duplicates(parsed, results, offset)
+
+    try:
+        with transaction.atomic():
+            commit_chunk(valid, results, offset)
+    except (InsufficientStock, IntegrityError):
+        # stock or bill numbers moved since the snapshot, replay the chunk sale by sale
+        logger.warning('bulk chunk at %s lost a race, retrying one sale at a time', offset)
+        for index, sale in valid:
+            try:
+                with transaction.atomic():
+                    created = create_sales([sale])[0]
+                    ledger.sell(sale_lines([sale], [created]))
+            except InsufficientStock as error:
+                results[index] = rejected(offset + index, sale, {'details': shortage_errors(error.shortages)})
+            except IntegrityError:
+                original = Sale.objects.filter(store_id=sale['store'], number=sale['number']).first()
+                results[index] = duplicate(offset + index, sale, id=original and original.id)
+            else:
+                results[index] = {'index': offset + index, 'number': sale['number'], 'status': CREATED, 'id': created.id}
+    return results
+
+
+def skip_duplicates(parsed, results, offset):
+    """
+    Drop sales whose (store, number) is already recorded, found with one
+    query on the unique index, or repeated earlier in the chunk
+    """
+    recorded = {
+        (store_id, number): sale_id
+        for store_id, number, sale_id in Sale.objects.filter(
+            store_id__in={sale['store'] for index, sale in parsed},
+            number__in={sale['number'] for index, sale in parsed}
+        ).values_list('store_id', 'number', 'id')
+    }
+    first = {}
+    valid = []
+    for index, sale in parsed:
+        key = (sale['store'], sale['number'])
+        if key in recorded:
+            results[index] = duplicate(offset + index, sale, id=recorded[key])
+        elif key in first:
+            results[index] = duplicate(offset + index, sale, duplicate_of=offset + first[key])
+        else:
+            first[key] = index
+            valid.append((index, sale))
+    return valid
+
+
+def commit_chunk(valid, results, offset):
+    """
+    Check every sale of the chunk against one locked inventory snapshot,
+    then write the accepted ones with bulk inserts and one set-based decrement
+    """
+    keys = sale_quantities(sale for index, sale in valid)
+    write_lock()
+    lock_rows(keys)
+    available = ledger.current_stock(keys)
+
+    accepted = []
+    for index, sale in valid:
+        quantities = sale_quantities([sale])
+        short = shortages(quantities, available)
+        if short:
+            results[index] = rejected(offset + index, sale, {'details': shortage_errors(short)})
+            continue
+        for key, quantity in quantities.items():
+            available[key] -= quantity
+        accepted.append((index, sale))
+
+    sales = create_sales([sale for index, sale in accepted])
+    ledger.sell(sale_lines([sale for index, sale in accepted], sales))
+    for (index, sale), created in zip(accepted, sales):
+        results[index] = {'index': offset + index, 'number': sale['number'], 'status': CREATED, 'id': created.id}
+
+
+def create_sales(sales):
+    """
+    Insert sales and all of their details and add them to the daily
+    rollup. Rows are written with plain
+    INSERTs because ORM instance preparation dominates the cost of large
+    uploads; ids come back from the bulk insert where the backend supports
+    it and from the cursor otherwise.
+    """
+    today = datetime.date.today()
+    instances = [Sale(number=sale['number'], store_id=sale['store'], date=today) for sale in sales]
+    if connection.features.can_return_ids_from_bulk_insert:
+        Sale.objects.bulk_create(instances)
+    else:
+        sql = insert_sql(Sale, ['number', 'store_id', 'date'])
+        with connection.cursor() as cursor:
+            for instance in instances:
+                cursor.execute(sql, [instance.number, instance.store_id, connection.ops.adapt_datefield_value(today)])
+                instance.id = cursor.lastrowid
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    value = SaleDetail._meta.get_field('value')
+    with connection.cursor() as cursor:
+        cursor.executemany(insert_sql(SaleDetail, ['sale_id', 'product_id', 'quantity', 'value', 'date_lst']), [
+            [instance.id, product_id, quantity,
+             connection.ops.adapt_decimalfield_value(amount, value.max_digits, value.decimal_places), now]
+            for sale, instance in zip(sales, instances)
+            for product_id, quantity, amount in sale['details']
+        ])
+    rollups.record_sales(today, [
+        (sale['store'], product_id, quantity, amount)
+        for sale in sales
+        for product_id, quantity, amount in sale['details']
+    ])
+    return instances
+
+
+def sale_lines(sales, instances):
+    """
+    (sale_id, store_id, product_id, quantity) lines of created sales
+    """
+    return [
+        (instance.id, sale['store'], product_id, quantity)
+        for sale, instance in zip(sales, instances)
+        for product_id, quantity, value in sale['details']
+    ]
+
+
+def sale_quantities(sales):
+    return aggregate(
+        (sale['store'], product_id, quantity)
+        for sale in sales
+        for product_id, quantity, value in sale['details']
+    )
+
+
+def load_catalog(items):
+    """
+    Stores and product prices referenced by a chunk, from the catalog cache
+    or one query each for the ones missing
+    """
+    store_ids = set()
+    product_ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        store_ids.add(integer(item.get('store')))
+        details = item.get('details')
+        if isinstance(details, list):
+            product_ids.update(integer(detail.get('product_id')) for detail in details if isinstance(detail, dict))
+    store_ids.discard(None)
+    product_ids.discard(None)
+    stores = set(catalog.get_stores(store_ids))
+    products = {product_id: product.price for product_id, product in catalog.get_products(product_ids).items()}
+    return stores, products
+
+
+def parse_sale(item, stores, products):
+    """
+    Validate a raw sale payload against the preloaded catalog without touching
+    the database. Returns (sale, errors).
+    """
+    if isinstance(item, Exception):
+        return None, {'non_field_errors': [str(item)]}
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': [_('a sale object is required')]}
+
+    errors = {}
+    number = item.get('number')
+    if number is None or not str(number).strip():
+        errors['number'] = [_('this field is required')]
+    elif len(str(number)) > NUMBER_MAX_LENGTH:
+        errors['number'] = [_('ensure this field has no more than %(max)s characters') % {'max': NUMBER_MAX_LENGTH}]
+
+    store = integer(item.get('store'))
+    if item.get('store') in (None, ''):
+        errors['store'] = [_('this field is required')]
+    elif store not in stores:
+        errors['store'] = [_('store not found')]
+
+    details = item.get('details')
+    lines = []
+    if not isinstance(details, list) or not details:
+        errors['details'] = [_('this list is required')]
+    else:
+        detail_errors = [parse_detail(detail, products, lines) for detail in details]
+        if any(detail_errors):
+            errors['details'] = detail_errors
+
+    if errors:
+        return None, errors
+    return {'number': str(number), 'store': store, 'details': lines}, {}
+
+
+def parse_detail(detail, products, lines):
+    if not isinstance(detail, dict):
+        return {'non_field_errors': [_('a detail object is required')]}
+    errors = {}
+    product_id = integer(detail.get('product_id'))
+    if product_id not in products:
+        errors['product_id'] = [_('product not found')]
+    quantity = integer(detail.get('quantity'))
+    if quantity is None or quantity <= 0:
+        errors['quantity'] = [_('quantity must be greater than zero')]
+    elif quantity > QUANTITY_MAX:
+        errors['quantity'] = [_('quantity cannot be greater than %(max)s') % {'max': QUANTITY_MAX}]
+    value = detail.get('value')
+    if value not in (None, ''):
+        try:
+            value = LINE_VALUE.run_validation(value)
+        except ValidationError as error:
+            errors['value'] = error.detail
+    else:
+        value = None
+    if errors:
+        return errors
+    lines.append((product_id, quantity, products[product_id] * quantity if value is None else value))
+    return {}
+
+
+def integer(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def duplicate(index, sale, **original):
+    return dict({'index': index, 'number': sale['number'], 'status': DUPLICATE}, **original)
+
+
+def rejected(index, item, errors):
+    number = item.get('number') if isinstance(item, dict) else None
+    return {'index': index, 'number': number, 'status': REJECTED, 'errors': errors}
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Store, Product
+
+
+class LRUCache:
+    """
+    Thread safe, size bounded in-process cache with least recently used
+    eviction and a time to live, so other processes' edits are picked up.
+
+    Every invalidation bumps `version`; values loaded from the database while
+    an invalidation happened are not stored, so a slow reader cannot put back
+    a stale row.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None or entry[0] < now:
+                    self.misses += 1
+                    continue
+                self.entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, values, version):
+        expires = time.monotonic() + self.timeout
+        with self.lock:
+            if version != self.version:
+                return
+            for key, value in values.items():
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.version += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+products = LRUCache(settings.INVENTORY_CATALOG_SIZE, settings.INVENTORY_CATALOG_TIMEOUT)
+stores = LRUCache(settings.INVENTORY_CATALOG_SIZE, settings.INVENTORY_CATALOG_TIMEOUT)
+
+
+def load(cache, model, ids):
+    ids = set(ids)
+    found = cache.get_many(ids)
+    missing = ids.difference(found)
+    if missing:
+        version = cache.version
+        loaded = model.objects.in_bulk(missing)
+        cache.set_many(loaded, version)
+        found.update(loaded)
+    return found
+
+
+def get_products(ids):
+    """
+    Products by id, only the ones not cached are fetched, in one query
+    """
+    return load(products, Product, ids)
+
+
+def get_stores(ids):
+    return load(stores, Store, ids)
+
+
+def get_store(store_id):
+    return get_stores([store_id]).get(store_id)
+
+
+def invalidate(cache, key):
+    # drop now for this thread and again on commit, once other threads see the change
+    cache.invalidate(key)
+    transaction.on_commit(lambda: cache.invalidate(key))
+
+
+def invalidate_product(product_id):
+    invalidate(products, product_id)
+
+
+def invalidate_store(store_id):
+    invalidate(stores, store_id)
+
+
+def clear():
+    products.clear()
+    stores.clear()
+
+
+def stats():
+    return {'products': products.stats(), 'stores': stores.stats()}
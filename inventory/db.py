@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+
+
+def configure_sqlite(connection):
+    """
+    Apply INVENTORY_SQLITE_PRAGMAS to a new SQLite connection. Most of them
+    only last for the connection, which is why persistent connections
+    (CONN_MAX_AGE) matter: the pragmas run once per connection, not per request.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.INVENTORY_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def estimated_count(queryset):
+    """
+    Rows of the queryset's table from the planner statistics, without reading
+    the table: `reltuples` on PostgreSQL, `table_rows` on MySQL and the id
+    range on SQLite, which over-counts the rows deleted in between
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'mysql':
+        sql, params = 'SELECT table_rows FROM information_schema.tables ' \
+                      'WHERE table_schema = DATABASE() AND table_name = %s', [table]
+    else:
+        bounds = model._default_manager.using(queryset.db).aggregate(low=Min('pk'), high=Max('pk'))
+        return bounds['high'] - bounds['low'] + 1 if bounds['high'] is not None else 0
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return max(int(row[0]), 0) if row and row[0] is not None else None
@@ -0,0 +1,89 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Inventory, Sale, SaleDetail
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    NDJSON: 'application/x-ndjson',
+}
+
+# model, exported columns, date column and store column used by the filters
+EXPORTS = {
+    'sale': (
+        Sale,
+        ['id', 'number', 'store_id', 'date'],
+        'date',
+        'store_id',
+    ),
+    'sale-detail': (
+        SaleDetail,
+        ['id', 'sale_id', 'sale__number', 'sale__store_id', 'sale__date', 'product_id', 'quantity', 'value',
+         'date_lst'],
+        'sale__date',
+        'sale__store_id',
+    ),
+    'inventory': (
+        Inventory,
+        ['id', 'store_id', 'product_id', 'available', 'date_lst'],
+        'date_lst__date',
+        'store_id',
+    ),
+}
+
+
+def export_rows(kind, store=None, date_from=None, date_to=None, chunk_size=2000):
+    """
+    Yield the header and then every row of an export as tuples.
+
+    Rows are read in keyset chunks (`id > last ORDER BY id LIMIT n`), so
+    memory stays flat and no cursor or transaction is held open between
+    chunks, whatever the size of the table.
+    """
+    model, columns, date_column, store_column = EXPORTS[kind]
+    queryset = model.objects.order_by('id')
+    if store is not None:
+        queryset = queryset.filter(**{store_column: store})
+    if date_from is not None:
+        queryset = queryset.filter(**{f'{date_column}__gte': date_from})
+    if date_to is not None:
+        queryset = queryset.filter(**{f'{date_column}__lte': date_to})
+
+    yield columns
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(id__gt=last)
+        rows = list(chunk.values_list(*columns)[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    columns = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(kind, output, **options):
+    rows = export_rows(kind, **options)
+    if output == CSV:
+        return csv_lines(rows)
+    return ndjson_lines(rows)
@@ -0,0 +1,64 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+PARAMETERS = ('fields', 'omit', 'expand')
+
+
+def names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def sparse_fields(request):
+    """
+    (fields, omit, expand) asked by a GET request with `?fields=`, `?omit=`
+    or `?expand=`, comma separated names; None when it asks for none
+    """
+    if request is None or request.method != 'GET':
+        return None
+    params = request.query_params
+    if not any(name in params for name in PARAMETERS):
+        return None
+    return tuple(names(params.get(name, '')) for name in PARAMETERS)
+
+
+def restrict(queryset, serializer):
+    """
+    Load only the columns and the relations the serializer renders: `only()`
+    the model fields behind its fields and `select_related` just the
+    relations rendered as nested objects (every column) or read through
+    (`store.name`, that column)
+    """
+    model = queryset.model
+    columns = {model._meta.pk.name}
+    related = set()
+    nested = set()
+    through = set()
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField) or field.source == '*':
+            # reads anything from the instance
+            return queryset
+        path = field.source.split('.')
+        try:
+            model_field = model._meta.get_field(path[0])
+        except FieldDoesNotExist:
+            # annotation or property
+            continue
+        if not model_field.concrete:
+            continue
+        columns.add(path[0])
+        if not model_field.is_relation:
+            continue
+        if isinstance(field, serializers.BaseSerializer):
+            related.add(path[0])
+            nested.add(path[0])
+        elif len(path) > 1:
+            related.add(path[0])
+            through.add('__'.join(path))
+    columns.update(name for name in through if name.split('__')[0] not in nested)
+    queryset = queryset.select_related(None)
+    if related:
+        # select_related() without names would follow every relation
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
@@ -0,0 +1,30 @@
+import django_filters
+from rest_framework.filters import SearchFilter
+
+from . import search
+from .models import DailySale
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    `search` matched on the FTS5 name index, every word as a prefix and the
+    results ordered by relevance. Falls back to the view's `search_fields`
+    when the index is not available (other databases).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search.available(queryset.model):
+            return super().filter_queryset(request, queryset, view)
+        return search.search(queryset, terms)
+
+
+class DailySaleFilter(django_filters.FilterSet):
+    store = django_filters.NumberFilter(field_name='store_id')
+    product = django_filters.NumberFilter(field_name='product_id')
+    date_from = django_filters.DateFilter(field_name='date', lookup_expr='gte')
+    date_to = django_filters.DateFilter(field_name='date', lookup_expr='lte')
+
+    class Meta:
+        model = DailySale
+        fields = ['store', 'product', 'date_from', 'date_to']
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import caches
+
+KEY = 'inventory:sale:idempotency:{user}:{key}'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def cache():
+    return caches[settings.INVENTORY_IDEMPOTENCY_CACHE]
+
+
+def cache_key(request):
+    """
+    Cache key of the request's Idempotency-Key header, scoped to the user
+    """
+    key = request.META.get('HTTP_IDEMPOTENCY_KEY', '').strip()
+    if not key:
+        return None
+    return KEY.format(user=request.user.pk, key=key)
+
+
+def replay(request):
+    """
+    (data, status) of the first request sent with the same Idempotency-Key
+    """
+    key = cache_key(request)
+    if key is None:
+        return None
+    return cache().get(key)
+
+
+def remember(request, data, status):
+    key = cache_key(request)
+    if key is not None:
+        cache().set(key, (data, status), settings.INVENTORY_IDEMPOTENCY_TIMEOUT)
+
+
+def sale_key(data):
+    """
+    (store_id, number) of a raw sale payload, None when it cannot identify a sale
+    """
+    try:
+        store = int(data.get('store'))
+        number = data.get('number')
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if number is None or not str(number).strip():
+        return None
+    return store, str(number)
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import snapshots, stock
+from .models import Inventory, StockMovement
+from .stock import InsufficientStock, aggregate, decrement_stock, increment_stock, inventory_rows, lock_rows, \
+    shortages, write_lock
+from .upserts import insert_sql
+
+
+def record(movements, applied, transfer_id=None):
+    """
+    Append (kind, store_id, product_id, quantity, sale_id) movements with one
+    prepared statement
+    """
+    movements = list(movements)
+    if not movements:
+        return
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            insert_sql(StockMovement, ['kind', 'store_id', 'product_id', 'quantity', 'sale_id', 'transfer_id',
+                                       'applied', 'date']),
+            [(kind, store_id, product_id, quantity, sale_id, transfer_id, applied, now)
+             for kind, store_id, product_id, quantity, sale_id in movements]
+        )
+
+
+def with_stock(queryset):
+    """
+    Annotate inventory rows with the `pending` movements not compacted yet
+    and the current `stock`, read in the same query as the row
+    """
+    pending = StockMovement.objects.filter(
+        store_id=OuterRef('store_id'), product_id=OuterRef('product_id'), applied=False
+    ).order_by().values('store_id', 'product_id').annotate(total=Sum('quantity')).values('total')
+    return queryset.annotate(
+        pending=Coalesce(Subquery(pending, output_field=IntegerField()), Value(0))
+    ).annotate(stock=F('available') + F('pending'))
+
+
+def low_stock(threshold, store_id=None):
+    """
+    stock.low_stock on the current stock. With INVENTORY_STOCK_DEFERRED the
+    snapshot lags behind the sales, so the rows low on the snapshot and the
+    rows with pending movements are read through their indexes and checked
+    against their `stock`.
+    """
+    rows = stock.low_stock(threshold, store_id)
+    if not settings.INVENTORY_STOCK_DEFERRED:
+        return rows
+    qn = connection.ops.quote_name
+    pending = RawSQL(
+        'SELECT {i}.{id} FROM {m} JOIN {i} ON {i}.{store} = {m}.{store} AND {i}.{product} = {m}.{product} '
+        'WHERE {m}.{applied} = %s'.format(
+            i=qn(Inventory._meta.db_table), m=qn(StockMovement._meta.db_table), id=qn('id'),
+            store=qn('store_id'), product=qn('product_id'), applied=qn('applied')),
+        [False]
+    )
+    rows = with_stock(Inventory.objects.filter(Q(id__in=rows.values('id')) | Q(id__in=pending)))
+    if store_id is not None:
+        rows = rows.filter(store_id=store_id)
+    return rows.filter(
+        Q(reorder_point__isnull=True, stock__lte=threshold) |
+        Q(reorder_point__isnull=False, stock__lte=F('reorder_point'))
+    )
+
+
+def current_stock(keys):
+    """
+    Current stock of (store_id, product_id) keys, missing when not stocked
+    """
+    return {
+        (store_id, product_id): stock
+        for store_id, product_id, stock in
+        with_stock(inventory_rows(keys)).values_list('store_id', 'product_id', 'stock')
+    }
+
+
+def sell(lines):
+    """
+    Take sold (sale_id, store_id, product_id, quantity) lines out of stock
+    and append them to the ledger, or raise InsufficientStock. Must run inside
+    the transaction recording the sales.
+
+    By default the inventory rows are decremented right away. With
+    INVENTORY_STOCK_DEFERRED the stock is only checked and the movements
+    stay pending until `compact`, so best sellers are not rewritten by every
+    sale. The rows are still locked while the stock is checked, otherwise
+    two sales could take the same units: sales of one product queue on its
+    row in both modes.
+    """
+    lines = list(lines)
+    quantities = aggregate((store_id, product_id, quantity) for sale_id, store_id, product_id, quantity in lines)
+    deferred = settings.INVENTORY_STOCK_DEFERRED
+    if deferred:
+        keys = sorted(quantities)
+        lock_rows(keys)
+        short = shortages(quantities, current_stock(keys))
+        if short:
+            raise InsufficientStock(short)
+    else:
+        decrement_stock(quantities)
+    record([
+        (StockMovement.SALE, store_id, product_id, -quantity, sale_id)
+        for sale_id, store_id, product_id, quantity in lines
+    ], applied=not deferred)
+
+
+def transfer(stock_transfer, quantities):
+    """
+    Move `quantities`, a mapping of product_id to units, from the transfer's
+    source store to its target and append both sides to the ledger, or raise
+    InsufficientStock. Must run inside the transaction recording the transfer.
+
+    The rows of both stores are locked together in (store, product) order,
+    the order sales lock them in, so concurrent transfers and sales cannot
+    deadlock. The source is discounted with the conditional UPDATE of sales
+    and the target is added to with one upsert, creating its missing rows.
+    With INVENTORY_STOCK_DEFERRED both sides stay pending as in `sell`.
+    """
+    source_id, target_id = stock_transfer.source_id, stock_transfer.target_id
+    taken = {(source_id, product_id): quantity for product_id, quantity in quantities.items()}
+    added = {(target_id, product_id): quantity for product_id, quantity in quantities.items()}
+    lock_rows(sorted(set(taken) | set(added)))
+    deferred = settings.INVENTORY_STOCK_DEFERRED
+    if deferred:
+        short = shortages(taken, current_stock(sorted(taken)))
+        if short:
+            raise InsufficientStock(short)
+        # pending movements are only read and compacted through an inventory row
+        Inventory.objects.bulk_create([
+            Inventory(store_id=store_id, product_id=product_id, available=0) for store_id, product_id in added
+        ], ignore_conflicts=True)
+    else:
+        decrement_stock(taken)
+        increment_stock(added)
+    record([
+        (StockMovement.TRANSFER, store_id, product_id, sign * quantity, None)
+        for sign, lines in ((-1, taken), (1, added))
+        for (store_id, product_id), quantity in sorted(lines.items())
+    ], applied=not deferred, transfer_id=stock_transfer.id)
+
+
+def compact():
+    """
+    Fold every pending movement into its inventory row and mark it applied,
+    in one transaction. Returns the number of movements folded.
+    """
+    qn = connection.ops.quote_name
+    movement = qn(StockMovement._meta.db_table)
+    inventory = qn(Inventory._meta.db_table)
+    with transaction.atomic():
+        # the pending movements are read before the rows are written
+        write_lock()
+        pending = StockMovement.objects.filter(applied=False)
+        last = pending.order_by('-id').values_list('id', flat=True).first()
+        if last is None:
+            return 0
+        stores = set(pending.filter(id__lte=last).values_list('store_id', flat=True).distinct())
+        # the rows without pending movements are left alone, their SUM would be NULL
+        pending_sql = 'FROM {m} WHERE {m}.{store} = {i}.{store} AND {m}.{product} = {i}.{product} ' \
+                      'AND {m}.{applied} = %s AND {m}.{id} <= %s'.format(
+                          m=movement, i=inventory, store=qn('store_id'), product=qn('product_id'),
+                          applied=qn('applied'), id=qn('id'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {i} SET {available} = {available} + (SELECT SUM({m}.{quantity}) {pending}), {date_lst} = %s '
+                'WHERE EXISTS (SELECT 1 {pending})'.format(
+                    i=inventory, m=movement, available=qn('available'), quantity=qn('quantity'),
+                    date_lst=qn('date_lst'), pending=pending_sql),
+                [False, last, connection.ops.adapt_datetimefield_value(timezone.now()), False, last]
+            )
+        folded = pending.filter(id__lte=last).update(applied=True)
+    for store_id in stores:
+        snapshots.invalidate_store(store_id)
+    return folded
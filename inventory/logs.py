@@ -0,0 +1,105 @@
+import atexit
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+
+class Listener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # wait for room on a full queue, the writer thread is still draining it
+        self.queue.put(self._sentinel)
+
+
+class AsyncHandler(QueueHandler):
+    """
+    Hands records to a background thread that runs the real handlers, so
+    file and console I/O never happens while a request waits.
+
+    Records are queued as they are: the message is formatted by the writer
+    thread, not by the caller, so arguments must not be changed after they
+    are logged. A full queue drops the record and counts it in `dropped`
+    instead of blocking the request.
+    """
+
+    def __init__(self, handlers, maxsize=0):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.listener = Listener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only a `rate` fraction of the records logged with
+    `extra=sampled(...)`, every other record passes
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return not getattr(record, 'sampled', False) or random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Appends the `fields` given with `extra=fields(...)` to the message as key=value pairs
+    """
+
+    def format(self, record):
+        message = super().format(record)
+        values = getattr(record, 'fields', None)
+        if values:
+            message += ' ' + ' '.join(f'{key}={value}' for key, value in values.items())
+        return message
+
+
+def fields(**values):
+    return {'fields': values}
+
+
+def sampled(**values):
+    return {'fields': values, 'sampled': True}
+
+
+def install(names, maxsize, rate):
+    """
+    Move the handlers of the `names` loggers behind one AsyncHandler each,
+    sampling the records flagged by `sampled` at `rate`
+    """
+    installed = []
+    for name in names:
+        logger = logging.getLogger(name)
+        if not logger.handlers or any(isinstance(handler, AsyncHandler) for handler in logger.handlers):
+            continue
+        handler = AsyncHandler(logger.handlers, maxsize)
+        handler.addFilter(SamplingFilter(rate))
+        logger.handlers = [handler]
+        atexit.register(handler.close)
+        installed.append(handler)
+    return installed
+
+
+def setup():
+    return install(settings.INVENTORY_ASYNC_LOGGERS, settings.INVENTORY_LOG_QUEUE_SIZE,
+                   settings.INVENTORY_LOG_SAMPLE_RATE)
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory import archive
+
+
+class Command(BaseCommand):
+    help = 'Move old sales and their details to the archive database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.INVENTORY_ARCHIVE_AFTER_DAYS,
+                            help='archive the sales older than this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.INVENTORY_ARCHIVE_BATCH_SIZE,
+                            help='sales moved per transaction')
+        parser.add_argument('--interval', type=float, help='keep running, archiving every this many seconds')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                moved = archive.archive_sales(archive.horizon(options['days']), max(1, options['batch_size']))
+                self.stdout.write(f'{moved} sales archived in {time.monotonic() - started:.2f}s')
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('stopped')
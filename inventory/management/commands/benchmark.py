@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from inventory import benchmark, catalog
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway test database, load the inventory API and report latency and queries as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=5)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--sales', type=int, default=2000, help='historical sales seeded before the run')
+        parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='threads sending requests')
+        parser.add_argument('--scenario', action='append', choices=benchmark.SCENARIOS, dest='scenarios',
+                            help='run only this scenario, may be repeated')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('-o', '--output', help='write the report to this file instead of stdout')
+        parser.add_argument('--baseline', help='fail when the run regresses against this report')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='allowed latency and throughput change against the baseline, 0.2 is 20%%')
+        parser.add_argument('--save-baseline', help='also save the report as the new baseline at this path')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf8') as source:
+                baseline = json.load(source)
+
+        report = self.measure(options)
+        output = json.dumps(report, indent=2) + '\n'
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as target:
+                target.write(output)
+        else:
+            self.stdout.write(output, ending='')
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf8') as target:
+                target.write(output)
+
+        if baseline is not None:
+            found = benchmark.regressions(baseline, report, options['threshold'])
+            if found:
+                raise CommandError('performance regressed:\n' + '\n'.join(found))
+            self.stderr.write(self.style.SUCCESS('no regression against the baseline'))
+
+    def measure(self, options):
+        # concurrent writers need a database file, the in-memory SQLite test
+        # database locks whole tables across connections
+        test = connection.settings_dict.setdefault('TEST', {})
+        path = None
+        if connection.vendor == 'sqlite' and not test.get('NAME'):
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            test['NAME'] = path
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # the archive is read by the rollup rebuild of the seed, never the real one
+        others = {
+            alias: connections[alias].creation.create_test_db(verbosity=0, autoclobber=True)
+            for alias in connections if alias != DEFAULT_DB_ALIAS
+        }
+        try:
+            catalog.clear()
+            data = benchmark.seed(options['stores'], options['products'], options['sales'], seed=options['seed'])
+            scenarios = benchmark.run(data, options['requests'], options['concurrency'],
+                                      options['scenarios'] or benchmark.SCENARIOS, options['seed'])
+        finally:
+            for alias, name in others.items():
+                connections[alias].creation.destroy_test_db(name, verbosity=0)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if path is not None:
+                test['NAME'] = None
+                if os.path.exists(path):
+                    os.remove(path)
+        return {
+            'config': {
+                'vendor': connection.vendor,
+                'stores': options['stores'],
+                'products': options['products'],
+                'sales': options['sales'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'scenarios': scenarios,
+        }
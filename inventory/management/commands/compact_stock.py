@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import ledger
+
+
+class Command(BaseCommand):
+    help = 'Fold the pending stock movements into the inventory rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='keep running, compacting every this many seconds')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                folded = ledger.compact()
+                self.stdout.write(f'{folded} stock movements compacted in {time.monotonic() - started:.2f}s')
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('stopped')
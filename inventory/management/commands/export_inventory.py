@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from inventory.export import EXPORTS, FORMATS, CSV, export_lines
+
+
+def date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Stream sales, sale details or inventory as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='output', choices=FORMATS, default=CSV)
+        parser.add_argument('--store', type=int)
+        parser.add_argument('--date-from', type=date, help='YYYY-MM-DD')
+        parser.add_argument('--date-to', type=date, help='YYYY-MM-DD')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('-o', '--output-file', help='defaults to stdout')
+
+    def handle(self, *args, **options):
+        lines = export_lines(
+            options['kind'],
+            options['output'],
+            store=options['store'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            chunk_size=options['chunk_size']
+        )
+        if options['output_file']:
+            with open(options['output_file'], 'w', newline='', encoding='utf8') as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
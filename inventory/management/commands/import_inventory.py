@@ -0,0 +1,139 @@
+import csv
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory import catalog, snapshots
+from inventory.models import Store, Product, Inventory
+from inventory.upserts import upsert
+
+
+class Command(BaseCommand):
+    help = 'Load stores, products and opening inventory from CSV files in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', help='CSV with name, address and phone columns and an optional id')
+        parser.add_argument('--products', help='CSV with name, unit and price columns and an optional id')
+        parser.add_argument('--inventory', help='CSV with store, product and available columns')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='validate and load, then roll back')
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ('stores', 'products', 'inventory')):
+            raise CommandError('give at least one of --stores, --products or --inventory')
+        self.batch_size = options['batch_size']
+        self.now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        with transaction.atomic():
+            if options['stores']:
+                self.load(options['stores'], 'stores', self.store_batch)
+            if options['products']:
+                self.load(options['products'], 'products', self.product_batch)
+            if options['inventory']:
+                self.load(options['inventory'], 'inventory', self.inventory_batch)
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write('dry run, nothing was saved')
+                return
+
+        # bulk statements send no signals. This drops the copies of this process
+        # and, when INVENTORY_SNAPSHOT_CACHE is shared, the snapshots of every
+        # server; the other servers' catalogs expire after their timeout
+        catalog.clear()
+        snapshots.invalidate_all()
+        self.stdout.write(f'running servers may use cached stores and products for up to '
+                          f'{settings.INVENTORY_CATALOG_TIMEOUT}s')
+
+    def load(self, path, label, write_batch):
+        started = time.monotonic()
+        loaded = 0
+        errors = 0
+        with open(path, newline='', encoding='utf8') as source:
+            reader = enumerate(csv.DictReader(source), start=2)
+            while True:
+                batch = list(islice(reader, self.batch_size))
+                if not batch:
+                    break
+                rows = []
+                for line, record in batch:
+                    try:
+                        rows.append(self.parse(label, record))
+                    except (KeyError, ValueError, InvalidOperation) as error:
+                        errors += 1
+                        self.stderr.write(f'{path}:{line}: {error!r}')
+                rows, rejected = write_batch(rows)
+                for row in rejected:
+                    errors += 1
+                    self.stderr.write(f'{path}: unknown store or product in {row}')
+                loaded += len(rows)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{label}: {loaded} rows, {loaded / elapsed:.0f} rows/s')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: {loaded} rows loaded, {errors} rejected in {elapsed:.1f}s ({loaded / elapsed:.0f} rows/s)'
+        ))
+
+    def parse(self, label, record):
+        if label == 'stores':
+            return (
+                int(record['id']) if record.get('id') else None,
+                required(record, 'name'),
+                record.get('address') or '',
+                record.get('phone') or '',
+            )
+        if label == 'products':
+            unit = required(record, 'unit')
+            if unit not in dict(Product.UNITS):
+                raise ValueError(f'unknown unit {unit}')
+            price = Decimal(required(record, 'price'))
+            if price <= 0:
+                raise ValueError('price cannot be less than or equals zero')
+            return (int(record['id']) if record.get('id') else None, required(record, 'name'), unit, price)
+        available = int(required(record, 'available'))
+        if available < 0:
+            raise ValueError('availability cannot be less than zero')
+        return int(required(record, 'store')), int(required(record, 'product')), available
+
+    def store_batch(self, rows):
+        self.write_rows(Store, ['name', 'address', 'phone'], rows)
+        return rows, []
+
+    def product_batch(self, rows):
+        price = Product._meta.get_field('price')
+        self.write_rows(Product, ['name', 'unit', 'price'], [
+            row[:3] + (connection.ops.adapt_decimalfield_value(row[3], price.max_digits, price.decimal_places),)
+            for row in rows
+        ])
+        return rows, []
+
+    def write_rows(self, model, columns, rows):
+        """
+        Rows with an id are upserted on the primary key, rows without one are inserted
+        """
+        with_id = [row + (self.now,) for row in rows if row[0] is not None]
+        if with_id:
+            upsert(model, ['id'] + columns + ['date_lst'], ['id'], with_id)
+        model.objects.bulk_create([
+            model(**dict(zip(columns, row[1:]))) for row in rows if row[0] is None
+        ], batch_size=self.batch_size)
+
+    def inventory_batch(self, rows):
+        stores = set(Store.objects.filter(id__in={row[0] for row in rows}).values_list('id', flat=True))
+        products = set(Product.objects.filter(id__in={row[1] for row in rows}).values_list('id', flat=True))
+        valid = [row for row in rows if row[0] in stores and row[1] in products]
+        rejected = [row for row in rows if row[0] not in stores or row[1] not in products]
+        upsert(Inventory, ['store_id', 'product_id', 'available', 'date_lst'], ['store_id', 'product_id'],
+               [row + (self.now,) for row in valid])
+        return valid, rejected
+
+
+def required(record, column):
+    value = (record.get(column) or '').strip()
+    if not value:
+        raise ValueError(f'{column} is required')
+    return value
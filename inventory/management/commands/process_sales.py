@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory import outbox
+
+
+class Command(BaseCommand):
+    help = 'Record the sales queued by the sale API, one transaction per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.INVENTORY_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help='seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        try:
+            while True:
+                started = time.monotonic()
+                entries = outbox.process_batch(batch_size)
+                if entries:
+                    created = sum(1 for entry in entries if entry.status == entry.CREATED)
+                    self.stdout.write(f'{len(entries)} sales processed, {created} created '
+                                      f'in {time.monotonic() - started:.2f}s')
+                if len(entries) < batch_size:
+                    if options['once']:
+                        return
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('stopped')
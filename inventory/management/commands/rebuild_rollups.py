@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory import rollups
+from inventory.management.commands.export_inventory import date
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup from the sale details, archived days are kept'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date, help='YYYY-MM-DD, all history when omitted')
+        parser.add_argument('--date-to', type=date, help='YYYY-MM-DD, all history when omitted')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rollups.rebuild(options['date_from'], options['date_to'])
+        self.stdout.write(self.style.SUCCESS(f'{rows} daily totals rebuilt'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = 'Reindex the product and store names used by the search parameter'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('the search index is only kept on SQLite')
+        with transaction.atomic():
+            search.install(connection)
+            search.rebuild(connection)
+        self.stdout.write(self.style.SUCCESS('search index rebuilt'))
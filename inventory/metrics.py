@@ -0,0 +1,166 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from . import catalog
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Endpoint:
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+class Registry:
+    """
+    Per endpoint counters, keyed by (view name, method, status code)
+    """
+
+    def __init__(self):
+        self.endpoints = defaultdict(Endpoint)
+        self.lock = threading.Lock()
+
+    def observe(self, key, seconds, queries, sql_seconds):
+        with self.lock:
+            endpoint = self.endpoints[key]
+            endpoint.requests += 1
+            endpoint.buckets[bisect_left(BUCKETS, seconds)] += 1
+            endpoint.seconds += seconds
+            endpoint.queries += queries
+            endpoint.sql_seconds += sql_seconds
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                '# HELP inventory_http_requests_total Requests served.',
+                '# TYPE inventory_http_requests_total counter',
+            ]
+            lines += [f'inventory_http_requests_total{{{labels(key)}}} {endpoint.requests}'
+                      for key, endpoint in endpoints]
+            lines += [
+                '# HELP inventory_http_request_duration_seconds Request latency.',
+                '# TYPE inventory_http_request_duration_seconds histogram',
+            ]
+            for key, endpoint in endpoints:
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), endpoint.buckets):
+                    cumulative += count
+                    lines.append(f'inventory_http_request_duration_seconds_bucket{{{labels(key)},le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'inventory_http_request_duration_seconds_sum{{{labels(key)}}} {endpoint.seconds}')
+                lines.append(f'inventory_http_request_duration_seconds_count{{{labels(key)}}} {endpoint.requests}')
+            lines += [
+                '# HELP inventory_sql_queries_total SQL queries run while serving requests.',
+                '# TYPE inventory_sql_queries_total counter',
+            ]
+            lines += [f'inventory_sql_queries_total{{{labels(key)}}} {endpoint.queries}'
+                      for key, endpoint in endpoints]
+            lines += [
+                '# HELP inventory_sql_duration_seconds_total Time spent in SQL while serving requests.',
+                '# TYPE inventory_sql_duration_seconds_total counter',
+            ]
+            lines += [f'inventory_sql_duration_seconds_total{{{labels(key)}}} {endpoint.sql_seconds}'
+                      for key, endpoint in endpoints]
+
+        for name, stats in catalog.stats().items():
+            for counter in ('hits', 'misses'):
+                lines.append(f'inventory_catalog_{counter}_total{{cache="{name}"}} {stats[counter]}')
+        return '\n'.join(lines) + '\n'
+
+
+def labels(key):
+    view, method, status = key
+    return f'view="{view}",method="{method}",status="{status}"'
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of the current request
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records request count, latency histogram, SQL query count and SQL time
+    per endpoint and adds a Server-Timing header. Removed from the stack
+    when INVENTORY_METRICS_ENABLED is off, so it then costs nothing.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INVENTORY_METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        wrappers = [connection.execute_wrapper(timer) for connection in connections.all()]
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        registry.observe((view, request.method, response.status_code), seconds, timer.queries, timer.seconds)
+        response['Server-Timing'] = (
+            f'db;desc="{timer.queries} queries";dur={timer.seconds * 1000:.2f}, '
+            f'app;dur={(seconds - timer.seconds) * 1000:.2f}, total;dur={seconds * 1000:.2f}'
+        )
+        return response
+
+
+def allowed(request):
+    """
+    Whether a scrape comes from INVENTORY_METRICS_ALLOWED_IPS or carries the
+    INVENTORY_METRICS_TOKEN bearer token
+    """
+    if request.META.get('REMOTE_ADDR') in settings.INVENTORY_METRICS_ALLOWED_IPS:
+        return True
+    token = settings.INVENTORY_METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics(request):
+    if not allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,123 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, verbose_name='name')),
+                ('unit', models.CharField(choices=[('und', 'unity'), ('paq', 'package'), ('gr', 'gram')], max_length=5, verbose_name='unit')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='price')),
+                ('date_lst', models.DateTimeField(auto_now=True, verbose_name='last update date')),
+            ],
+            options={
+                'verbose_name': 'product',
+                'verbose_name_plural': 'products',
+                'db_table': 'inventory_product',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Sale',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=250, verbose_name='bill number')),
+                ('date', models.DateField(auto_now=True, verbose_name='bill date')),
+            ],
+            options={
+                'verbose_name': 'sale',
+                'verbose_name_plural': 'sales',
+                'db_table': 'inventory_sale',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Store',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=250, verbose_name='name')),
+                ('address', models.CharField(blank=True, max_length=250, verbose_name='address')),
+                ('phone', models.CharField(blank=True, max_length=10, verbose_name='phone')),
+                ('date_lst', models.DateTimeField(auto_now=True, verbose_name='last update date')),
+            ],
+            options={
+                'verbose_name': 'store',
+                'verbose_name_plural': 'stores',
+                'db_table': 'inventory_store',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleDetail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='quantity')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='value')),
+                ('date_lst', models.DateTimeField(auto_now=True, verbose_name='last update date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Product', verbose_name='product')),
+                ('sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory.Sale', verbose_name='sale')),
+            ],
+            options={
+                'verbose_name': 'sale detail',
+                'verbose_name_plural': 'sale details',
+                'db_table': 'inventory_sale_detail',
+                'ordering': ['sale', 'product__name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Store', verbose_name='store'),
+        ),
+        migrations.CreateModel(
+            name='Inventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available', models.PositiveIntegerField(default=0, verbose_name='available')),
+                ('date_lst', models.DateTimeField(auto_now=True, verbose_name='last update date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Product', verbose_name='store')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Store', verbose_name='store')),
+            ],
+            options={
+                'verbose_name': 'inventory',
+                'verbose_name_plural': 'inventory',
+                'db_table': 'inventory_inventory',
+                'ordering': ['store', 'product'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='saledetail',
+            index=models.Index(fields=['sale'], name='inventory_s_sale_id_8967fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saledetail',
+            index=models.Index(fields=['product'], name='inventory_s_product_d00d91_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['number'], name='inventory_s_number_f440f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['store'], name='inventory_i_store_i_44ca7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['product'], name='inventory_i_product_f4f8f8_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='inventory',
+            unique_together={('store', 'product')},
+        ),
+    ]
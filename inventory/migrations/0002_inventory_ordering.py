@@ -0,0 +1,17 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='inventory',
+            options={'ordering': ['store_id', 'product_id'], 'verbose_name': 'inventory', 'verbose_name_plural': 'inventory'},
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_inventory_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySale',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='units')),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=17, verbose_name='value')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Product', verbose_name='product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Store', verbose_name='store')),
+            ],
+            options={
+                'verbose_name': 'daily sale',
+                'verbose_name_plural': 'daily sales',
+                'db_table': 'inventory_daily_sale',
+                'ordering': ['-date', 'store_id', 'product_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailysale',
+            index=models.Index(fields=['store', 'date'], name='inventory_d_store_i_d8d9c5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysale',
+            index=models.Index(fields=['product', 'date'], name='inventory_d_product_673857_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysale',
+            unique_together={('store', 'product', 'date')},
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_daily_sale'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='reorder_point',
+            field=models.PositiveIntegerField(blank=True, help_text='low stock when available falls to this quantity, the global threshold is used when empty', null=True, verbose_name='reorder point'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['store', 'available'], name='inventory_i_store_i_8c408e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['reorder_point'], name='inventory_i_reorder_533070_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_numbers(apps, schema_editor):
+    """Stop before the unique index when a store already reused a bill number.
+
+    The rows are not merged or renumbered here: they are sales with their own details and stock movements, so
+    the duplicates have to be resolved by hand before migrating again.
+    """
+    Sale = apps.get_model('inventory', 'Sale')
+    duplicates = list(
+        Sale.objects.using(schema_editor.connection.alias)
+        .values('store_id', 'number')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('store_id', 'number')[:50]
+    )
+    if duplicates:
+        rows = ', '.join('store %(store_id)s number %(number)r (%(count)s sales)' % row for row in duplicates)
+        raise RuntimeError(
+            'The bill number must be unique per store before this migration can run. Fix these sales first: '
+            + rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_inventory_reorder_point'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_numbers, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='inventory_s_number_f440f2_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='sale',
+            unique_together={('store', 'number')},
+        ),
+    ]
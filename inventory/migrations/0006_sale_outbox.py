@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_sale_unique_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='ticket')),
+                ('number', models.CharField(max_length=250, verbose_name='bill number')),
+                ('payload', models.TextField(help_text='sale as sent by the client, JSON', verbose_name='payload')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('created', 'created'), ('rejected', 'rejected'), ('duplicate', 'duplicate')], default='pending', max_length=10, verbose_name='status')),
+                ('errors', models.TextField(blank=True, default='', help_text='reasons of a rejected sale, JSON', verbose_name='errors')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='accepted')),
+                ('date_lst', models.DateTimeField(blank=True, null=True, verbose_name='processed')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='inventory.Sale', verbose_name='sale')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Store', verbose_name='store')),
+            ],
+            options={
+                'verbose_name': 'queued sale',
+                'verbose_name_plural': 'queued sales',
+                'db_table': 'inventory_sale_outbox',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='saleoutbox',
+            index=models.Index(fields=['status', 'id'], name='inventory_s_status_a3badc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='saleoutbox',
+            index=models.Index(fields=['store', 'number'], name='inventory_s_store_i_e4e0f4_idx'),
+        ),
+    ]
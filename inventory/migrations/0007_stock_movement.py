@@ -0,0 +1,41 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_sale_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'sale'), ('receipt', 'receipt'), ('adjustment', 'adjustment'), ('transfer', 'transfer')], max_length=10, verbose_name='kind')),
+                ('quantity', models.IntegerField(help_text='units added, negative when taken out', verbose_name='quantity')),
+                ('applied', models.BooleanField(default=True, help_text='already counted in the inventory available', verbose_name='applied')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='date')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='inventory.Product', verbose_name='product')),
+                ('sale', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventory.Sale', verbose_name='sale')),
+                ('store', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='inventory.Store', verbose_name='store')),
+            ],
+            options={
+                'verbose_name': 'stock movement',
+                'verbose_name_plural': 'stock movements',
+                'db_table': 'inventory_stock_movement',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['store', 'product', 'applied'], name='inventory_s_store_i_8dc473_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['applied', 'id'], name='inventory_s_applied_fea38b_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_stock_movement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTransfer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lines', models.PositiveIntegerField(default=0, verbose_name='lines')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='units')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='date')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfers_out', to='inventory.Store', verbose_name='source store')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='transfers_in', to='inventory.Store', verbose_name='target store')),
+            ],
+            options={
+                'verbose_name': 'stock transfer',
+                'verbose_name_plural': 'stock transfers',
+                'db_table': 'inventory_stock_transfer',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='transfer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='inventory.StockTransfer', verbose_name='transfer'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_sale_number_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSale',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=250, verbose_name='bill number')),
+                ('store_id', models.PositiveIntegerField(verbose_name='store')),
+                ('date', models.DateField(verbose_name='date')),
+            ],
+            options={
+                'verbose_name': 'archived sale',
+                'verbose_name_plural': 'archived sales',
+                'db_table': 'inventory_archived_sale',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedSaleDetail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveIntegerField(verbose_name='product')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='quantity')),
+                ('value', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='value')),
+                ('date_lst', models.DateTimeField(verbose_name='last update date')),
+            ],
+            options={
+                'verbose_name': 'archived sale detail',
+                'verbose_name_plural': 'archived sale details',
+                'db_table': 'inventory_archived_sale_detail',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='sale',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='inventory.Sale', verbose_name='sale'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date'], name='inventory_s_date_8972d4_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedsaledetail',
+            name='sale',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saledetail_set', to='inventory.ArchivedSale', verbose_name='sale'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsale',
+            index=models.Index(fields=['date'], name='inventory_a_date_cdfad8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsale',
+            index=models.Index(fields=['store_id', 'date'], name='inventory_a_store_i_052d6f_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedsale',
+            unique_together={('store_id', 'number')},
+        ),
+    ]
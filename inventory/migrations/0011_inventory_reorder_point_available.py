@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_archived_sale'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='inventory',
+            name='inventory_i_reorder_533070_idx',
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(fields=['reorder_point', 'available'], name='inventory_i_reorder_d76710_idx'),
+        ),
+    ]
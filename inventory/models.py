@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404
@@ -89,6 +91,12 @@ class Inventory(models.Model):
         _('available'),
         default=0
     )
+    reorder_point = models.PositiveIntegerField(
+        _('reorder point'),
+        null=True,
+        blank=True,
+        help_text=_('low stock when available falls to this quantity, the global threshold is used when empty')
+    )
     date_lst = models.DateTimeField(
         _('last update date'),
         auto_now=True
@@ -101,11 +109,13 @@ class Inventory(models.Model):
         verbose_name = _('inventory')
         verbose_name_plural = _('inventory')
         db_table = "inventory_inventory"
-        ordering = ['store', 'product']
+        ordering = ['store_id', 'product_id']
         unique_together = (('store', 'product'),)
         indexes = [
             models.Index(fields=['store']),
             models.Index(fields=['product']),
+            models.Index(fields=['store', 'available']),
+            models.Index(fields=['reorder_point', 'available']),
         ]
 
 
@@ -134,8 +144,12 @@ class Sale(models.Model):
         verbose_name_plural = _('sales')
         db_table = "inventory_sale"
         ordering = ['-id']
+        unique_together = (('store', 'number'),)
         indexes = [
+            # bill number lookups across stores, the unique index leads with the store
             models.Index(fields=['number']),
+            # date ranges of the history and of the sales to archive
+            models.Index(fields=['date']),
         ]
 
 
@@ -177,3 +191,310 @@ class SaleDetail(models.Model):
             models.Index(fields=['sale']),
             models.Index(fields=['product']),
         ]
+
+
+class DailySale(models.Model):
+    """
+    Units and value sold per store, product and day, kept up to date in the
+    same transaction that records each sale
+    """
+    date = models.DateField(
+        _('date')
+    )
+    store = models.ForeignKey(
+        Store,
+        on_delete=models.PROTECT,
+        verbose_name=_('store')
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.PROTECT,
+        verbose_name=_('product')
+    )
+    units = models.PositiveIntegerField(
+        _('units'),
+        default=0
+    )
+    value = models.DecimalField(
+        _('value'),
+        max_digits=17,
+        decimal_places=2,
+        default=0
+    )
+
+    def __str__(self):
+        return f"{self.date} - {self.store_id} - {self.product_id} - {self.units}"
+
+    class Meta:
+        verbose_name = _('daily sale')
+        verbose_name_plural = _('daily sales')
+        db_table = "inventory_daily_sale"
+        ordering = ['-date', 'store_id', 'product_id']
+        unique_together = (('store', 'product', 'date'),)
+        indexes = [
+            models.Index(fields=['store', 'date']),
+            models.Index(fields=['product', 'date']),
+        ]
+
+
+class SaleOutbox(models.Model):
+    """
+    Sale accepted for later processing: the validated payload waits here
+    until the process_sales worker records it, and `ticket` is what the
+    client polls to learn the outcome
+    """
+    PENDING = 'pending'
+    CREATED = 'created'
+    REJECTED = 'rejected'
+    DUPLICATE = 'duplicate'
+    STATUSES = (
+        (PENDING, _('pending')),
+        (CREATED, _('created')),
+        (REJECTED, _('rejected')),
+        (DUPLICATE, _('duplicate')),
+    )
+
+    ticket = models.UUIDField(
+        _('ticket'),
+        default=uuid.uuid4,
+        unique=True,
+        editable=False
+    )
+    store = models.ForeignKey(
+        Store,
+        on_delete=models.PROTECT,
+        verbose_name=_('store')
+    )
+    number = models.CharField(
+        _('bill number'),
+        max_length=250
+    )
+    payload = models.TextField(
+        _('payload'),
+        help_text=_('sale as sent by the client, JSON')
+    )
+    status = models.CharField(
+        _('status'),
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING
+    )
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.SET_NULL,
+        verbose_name=_('sale'),
+        null=True,
+        blank=True
+    )
+    errors = models.TextField(
+        _('errors'),
+        blank=True,
+        default='',
+        help_text=_('reasons of a rejected sale, JSON')
+    )
+    date = models.DateTimeField(
+        _('accepted'),
+        auto_now_add=True
+    )
+    date_lst = models.DateTimeField(
+        _('processed'),
+        null=True,
+        blank=True
+    )
+
+    def __str__(self):
+        return f"{self.ticket} - {self.status}"
+
+    class Meta:
+        verbose_name = _('queued sale')
+        verbose_name_plural = _('queued sales')
+        db_table = "inventory_sale_outbox"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['store', 'number']),
+        ]
+
+
+class StockTransfer(models.Model):
+    """
+    Stock moved from one store to another in one transaction, its lines are
+    the `transfer` stock movements pointing to it
+    """
+    source = models.ForeignKey(
+        Store,
+        on_delete=models.PROTECT,
+        verbose_name=_('source store'),
+        related_name='transfers_out'
+    )
+    target = models.ForeignKey(
+        Store,
+        on_delete=models.PROTECT,
+        verbose_name=_('target store'),
+        related_name='transfers_in'
+    )
+    lines = models.PositiveIntegerField(
+        _('lines'),
+        default=0
+    )
+    units = models.PositiveIntegerField(
+        _('units'),
+        default=0
+    )
+    date = models.DateTimeField(
+        _('date'),
+        auto_now_add=True
+    )
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.target_id} - {self.units}"
+
+    class Meta:
+        verbose_name = _('stock transfer')
+        verbose_name_plural = _('stock transfers')
+        db_table = "inventory_stock_transfer"
+        ordering = ['-id']
+
+
+class StockMovement(models.Model):
+    """
+    Append-only record of every stock change. `applied` movements are already
+    counted in Inventory.available; pending ones are added to it when reading
+    the current stock until compaction folds them into the row.
+    """
+    SALE = 'sale'
+    RECEIPT = 'receipt'
+    ADJUSTMENT = 'adjustment'
+    TRANSFER = 'transfer'
+    KINDS = (
+        (SALE, _('sale')),
+        (RECEIPT, _('receipt')),
+        (ADJUSTMENT, _('adjustment')),
+        (TRANSFER, _('transfer')),
+    )
+
+    store = models.ForeignKey(
+        Store,
+        on_delete=models.PROTECT,
+        verbose_name=_('store'),
+        db_index=False
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.PROTECT,
+        verbose_name=_('product')
+    )
+    kind = models.CharField(
+        _('kind'),
+        max_length=10,
+        choices=KINDS
+    )
+    quantity = models.IntegerField(
+        _('quantity'),
+        help_text=_('units added, negative when taken out')
+    )
+    # old sales move to the archive database with their id, so the reference is kept without a constraint
+    sale = models.ForeignKey(
+        Sale,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        verbose_name=_('sale'),
+        null=True,
+        blank=True
+    )
+    transfer = models.ForeignKey(
+        StockTransfer,
+        on_delete=models.PROTECT,
+        verbose_name=_('transfer'),
+        null=True,
+        blank=True
+    )
+    applied = models.BooleanField(
+        _('applied'),
+        default=True,
+        help_text=_('already counted in the inventory available')
+    )
+    date = models.DateTimeField(
+        _('date'),
+        auto_now_add=True
+    )
+
+    def __str__(self):
+        return f"{self.store_id} - {self.product_id} - {self.kind} {self.quantity}"
+
+    class Meta:
+        verbose_name = _('stock movement')
+        verbose_name_plural = _('stock movements')
+        db_table = "inventory_stock_movement"
+        ordering = ['-id']
+        indexes = [
+            # pending movements of a row without scanning its history, also serves the store lookups
+            models.Index(fields=['store', 'product', 'applied']),
+            models.Index(fields=['applied', 'id']),
+        ]
+
+
+class ArchivedSale(models.Model):
+    """
+    Sale moved to the archive database by archive_sales, with its original
+    id. Stores are referenced by id only, they stay in the default database.
+    """
+    number = models.CharField(
+        _('bill number'),
+        max_length=250
+    )
+    store_id = models.PositiveIntegerField(
+        _('store')
+    )
+    date = models.DateField(
+        _('date')
+    )
+
+    def __str__(self):
+        return self.number
+
+    class Meta:
+        verbose_name = _('archived sale')
+        verbose_name_plural = _('archived sales')
+        db_table = "inventory_archived_sale"
+        ordering = ['-id']
+        unique_together = (('store_id', 'number'),)
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['store_id', 'date']),
+        ]
+
+
+class ArchivedSaleDetail(models.Model):
+    """
+    Sale detail moved to the archive database with its sale
+    """
+    sale = models.ForeignKey(
+        ArchivedSale,
+        on_delete=models.CASCADE,
+        verbose_name=_('sale'),
+        related_name='saledetail_set'
+    )
+    product_id = models.PositiveIntegerField(
+        _('product')
+    )
+    quantity = models.PositiveSmallIntegerField(
+        _('quantity')
+    )
+    value = models.DecimalField(
+        _('value'),
+        max_digits=15,
+        decimal_places=2
+    )
+    date_lst = models.DateTimeField(
+        _('last update date')
+    )
+
+    def __str__(self):
+        return f"{self.sale_id} - {self.product_id} - {self.quantity}"
+
+    class Meta:
+        verbose_name = _('archived sale detail')
+        verbose_name_plural = _('archived sale details')
+        db_table = "inventory_archived_sale_detail"
+        ordering = ['id']
@@ -0,0 +1,75 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bulk import DUPLICATE, ingest_chunk
+from .models import SaleOutbox
+from .stock import write_lock
+
+
+def accepts_async(request, default):
+    """
+    Whether a sale should be queued: `default` unless the client asks with
+    a `Prefer: respond-async` or `Prefer: respond-sync` header
+    """
+    prefer = {value.strip().lower() for value in request.META.get('HTTP_PREFER', '').split(',')}
+    if 'respond-async' in prefer:
+        return True
+    if 'respond-sync' in prefer:
+        return False
+    return default
+
+
+def enqueue(validated_data):
+    """
+    Store a sale validated by SaleSerializer for the worker, prices already resolved
+    """
+    store = validated_data['store']
+    payload = {
+        'number': validated_data['number'],
+        'store': store.id,
+        'details': [
+            {'product_id': detail['product'].id, 'quantity': detail['quantity'], 'value': detail['value']}
+            for detail in validated_data['details']
+        ],
+    }
+    return SaleOutbox.objects.create(store=store, number=validated_data['number'],
+                                     payload=json.dumps(payload, cls=DjangoJSONEncoder))
+
+
+def pending(store_id, number):
+    return SaleOutbox.objects.filter(store_id=store_id, number=number, status=SaleOutbox.PENDING).first()
+
+
+def process_batch(batch_size):
+    """
+    Record up to `batch_size` pending sales, oldest first, in one
+    transaction: the sales are inserted, the stock decrements aggregated per
+    (store, product) and the tickets updated together, so a crash leaves
+    them all pending. Returns the processed entries.
+    """
+    with transaction.atomic():
+        # the batch is read before its stock is, the write lock has to come first
+        write_lock()
+        queryset = SaleOutbox.objects.filter(status=SaleOutbox.PENDING).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            # concurrent workers take different batches
+            queryset = queryset.select_for_update(skip_locked=True)
+        entries = list(queryset[:batch_size])
+        if not entries:
+            return entries
+
+        results = ingest_chunk([json.loads(entry.payload) for entry in entries])
+        now = timezone.now()
+        for entry, result in zip(entries, results):
+            if result['status'] == DUPLICATE and 'duplicate_of' in result:
+                # repeated inside the batch, points to the sale of the first copy
+                result = dict(result, id=results[result['duplicate_of']].get('id'))
+            entry.status = result['status']
+            entry.sale_id = result.get('id')
+            entry.errors = json.dumps(result['errors'], cls=DjangoJSONEncoder) if 'errors' in result else ''
+            entry.date_lst = now
+        SaleOutbox.objects.bulk_update(entries, ['status', 'sale', 'errors', 'date_lst'])
+    return entries
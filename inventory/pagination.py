@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+from . import search
+from .db import estimated_count
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over an indexed, unique column. Pages are fetched with
+    `WHERE id > cursor ORDER BY id LIMIT n`, so no COUNT(*) is issued and a
+    deep page costs the same as the first one.
+
+    Views choose the column with a `cursor_ordering` attribute, `id` by default.
+    Full text search results are paged by relevance, or in index order when
+    there are too many matches to rank.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.INVENTORY_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        if search.RANK in queryset.query.annotations:
+            return (search.RANK, 'id')
+        if search.MATCH_ID in queryset.query.annotations:
+            return (search.MATCH_ID,)
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin changelist paginator that takes the size of an unfiltered list from
+    `estimated_count` instead of a COUNT(*) over the whole table, once it is
+    larger than INVENTORY_ADMIN_EXACT_COUNT_LIMIT. Filtered lists are counted.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is not None and not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > settings.INVENTORY_ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
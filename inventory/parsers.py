@@ -0,0 +1,32 @@
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON lazily, one document per line.
+
+    Returns a generator so the body is consumed while it is processed; lines
+    that are not valid JSON are yielded as ParseError instances so the caller
+    can reject them without aborting the whole upload.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.documents(codecs.getreader(encoding)(stream))
+
+    def documents(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                yield ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from . import catalog, ledger, snapshots
+from .bulk import integer
+from .models import Inventory, StockMovement
+from .stock import inventory_rows, lock_rows, write_lock
+from .upserts import upsert
+
+import logging
+logger = logging.getLogger(__name__)
+
+RECEIVED = 'received'
+ADJUSTED = 'adjusted'
+REJECTED = 'rejected'
+
+# the range of the PositiveIntegerField `available` column on every backend
+AVAILABLE_MAX = 2147483647
+
+
+def apply_counts(items):
+    """
+    Apply stock receipts and adjustments in one transaction. Each item names a
+    `store` and a `product` and either a `quantity` added to the stock
+    (negative to take units out) or the `available` units counted. Items of
+    the same row apply in input order. Returns one result per item, in input
+    order, with the stock it left; items that are invalid or would leave a
+    negative stock are rejected and the others applied.
+    """
+    stores, products = load_catalog(items)
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        count, errors = parse_count(item, stores, products)
+        if errors:
+            results[index] = rejected(index, item, errors)
+        else:
+            parsed.append((index, count))
+    if not parsed:
+        return results
+
+    with transaction.atomic():
+        keys = sorted({(count['store'], count['product']) for index, count in parsed})
+        write_lock()
+        lock_rows(keys)
+        rows = {
+            (store_id, product_id): (available, current)
+            for store_id, product_id, available, current in
+            ledger.with_stock(inventory_rows(keys)).values_list('store_id', 'product_id', 'available', 'stock')
+        }
+        stock = {key: current for key, (available, current) in rows.items()}
+        changes = {}
+        movements = []
+        for index, count in parsed:
+            key = (count['store'], count['product'])
+            current = stock.get(key, 0)
+            delta = count['quantity'] if count['available'] is None else count['available'] - current
+            if current + delta < 0:
+                results[index] = rejected(index, count, {'quantity': [_('insufficient stock')]}, available=current)
+                continue
+            if current + delta > AVAILABLE_MAX:
+                results[index] = rejected(index, count, {'quantity': [
+                    _('stock cannot be greater than %(max)s') % {'max': AVAILABLE_MAX}
+                ]}, available=current)
+                continue
+            kind = StockMovement.RECEIPT if count['available'] is None and delta > 0 else StockMovement.ADJUSTMENT
+            stock[key] = current + delta
+            changes[key] = changes.get(key, 0) + delta
+            if delta:
+                movements.append((kind, key[0], key[1], delta, None))
+            results[index] = {
+                'index': index, 'store': key[0], 'product': key[1],
+                'status': RECEIVED if kind == StockMovement.RECEIPT else ADJUSTED, 'available': stock[key],
+            }
+        write({key: rows.get(key, (0, 0))[0] + delta for key, delta in changes.items()})
+        ledger.record(movements, applied=not settings.INVENTORY_STOCK_DEFERRED)
+    logger.info('stock counts %s items, %s movements', len(items), len(movements))
+    return results
+
+
+def write(available):
+    """
+    Set the inventory rows to their new `available` units with one upsert,
+    creating the rows of products a store did not stock. With
+    INVENTORY_STOCK_DEFERRED the rows are only created and the movements stay
+    pending, as sales do.
+    """
+    if not available:
+        return
+    keys = sorted(available)
+    if settings.INVENTORY_STOCK_DEFERRED:
+        Inventory.objects.bulk_create([
+            Inventory(store_id=store_id, product_id=product_id, available=0) for store_id, product_id in keys
+        ], ignore_conflicts=True)
+        return
+    now = Inventory._meta.get_field('date_lst').get_db_prep_value(timezone.now(), connection)
+    # the rows are locked and their units read above, so the new value is written as is
+    upsert(Inventory, ['store_id', 'product_id', 'available', 'date_lst'], ['store_id', 'product_id'], [
+        (store_id, product_id, available[store_id, product_id], now) for store_id, product_id in keys
+    ])
+    for store_id in {store_id for store_id, product_id in keys}:
+        snapshots.invalidate_store(store_id)
+
+
+def load_catalog(items):
+    """
+    Ids of the stores and products referenced by the items, from the catalog
+    cache or one query each for the ones missing
+    """
+    store_ids = {integer(item.get('store')) for item in items if isinstance(item, dict)}
+    product_ids = {integer(item.get('product')) for item in items if isinstance(item, dict)}
+    store_ids.discard(None)
+    product_ids.discard(None)
+    return set(catalog.get_stores(store_ids)), set(catalog.get_products(product_ids))
+
+
+def parse_count(item, stores, products):
+    """
+    Validate a raw item against the preloaded catalog without touching the
+    database. Returns (count, errors).
+    """
+    if isinstance(item, Exception):
+        return None, {'non_field_errors': [str(item)]}
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': [_('a stock count object is required')]}
+    errors = {}
+    store = integer(item.get('store'))
+    if store not in stores:
+        errors['store'] = [_('store not found')]
+    product = integer(item.get('product'))
+    if product not in products:
+        errors['product'] = [_('product not found')]
+
+    quantity = item.get('quantity')
+    available = item.get('available')
+    if (quantity is None) == (available is None):
+        errors['non_field_errors'] = [_('either quantity or available is required')]
+    elif quantity is not None and integer(quantity) is None:
+        errors['quantity'] = [_('a valid integer is required')]
+    elif quantity is not None and abs(integer(quantity)) > AVAILABLE_MAX:
+        errors['quantity'] = [_('quantity must be between -%(max)s and %(max)s') % {'max': AVAILABLE_MAX}]
+    elif available is not None and (integer(available) is None or integer(available) < 0):
+        errors['available'] = [_('a valid positive integer is required')]
+    elif available is not None and integer(available) > AVAILABLE_MAX:
+        errors['available'] = [_('available cannot be greater than %(max)s') % {'max': AVAILABLE_MAX}]
+
+    if errors:
+        return None, errors
+    return {
+        'store': store,
+        'product': product,
+        'quantity': integer(quantity),
+        'available': integer(available),
+    }, {}
+
+
+def rejected(index, item, errors, **extra):
+    if not isinstance(item, dict):
+        item = {}
+    return dict({'index': index, 'store': item.get('store'), 'product': item.get('product'), 'status': REJECTED,
+                 'errors': errors}, **extra)
@@ -0,0 +1,92 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+
+from . import archive
+from .models import Sale, SaleDetail, DailySale
+from .upserts import upsert
+
+
+def record_sales(date, lines):
+    """
+    Add sold (store_id, product_id, quantity, value) lines of `date` to the
+    daily rollup with one upsert. Must run in the transaction recording the sales.
+    """
+    totals = defaultdict(lambda: [0, Decimal(0)])
+    for store_id, product_id, quantity, value in lines:
+        total = totals[store_id, product_id]
+        total[0] += quantity
+        total[1] += Decimal(str(value))
+    if not totals:
+        return
+    qn = connection.ops.quote_name
+    value = DailySale._meta.get_field('value')
+    date = connection.ops.adapt_datefield_value(date)
+    upsert(
+        DailySale,
+        ['date', 'store_id', 'product_id', 'units', 'value'],
+        ['store_id', 'product_id', 'date'],
+        [
+            (date, store_id, product_id, units,
+             connection.ops.adapt_decimalfield_value(amount, value.max_digits, value.decimal_places))
+            for (store_id, product_id), (units, amount) in sorted(totals.items())
+        ],
+        update={
+            'units': f"{qn(DailySale._meta.db_table)}.{qn('units')} + excluded.{qn('units')}",
+            'value': f"{qn(DailySale._meta.db_table)}.{qn('value')} + excluded.{qn('value')}",
+        }
+    )
+
+
+def rebuild(date_from=None, date_to=None):
+    """
+    Recompute the rollup of a date range, or of all history, from the sale
+    details with a single INSERT ... SELECT ... GROUP BY. The days up to the
+    newest archived sale keep their totals, their sales are no longer in this
+    database.
+    """
+    newest = archive.newest_date()
+    if newest is not None and (date_from is None or date_from <= newest):
+        date_from = newest + datetime.timedelta(days=1)
+        if date_to is not None and date_to < date_from:
+            return 0
+    qn = connection.ops.quote_name
+    sale = qn(Sale._meta.db_table)
+    rollups = DailySale.objects.all()
+    conditions = []
+    params = []
+    if date_from is not None:
+        rollups = rollups.filter(date__gte=date_from)
+        conditions.append(f"{sale}.{qn('date')} >= %s")
+        params.append(connection.ops.adapt_datefield_value(date_from))
+    if date_to is not None:
+        rollups = rollups.filter(date__lte=date_to)
+        conditions.append(f"{sale}.{qn('date')} <= %s")
+        params.append(connection.ops.adapt_datefield_value(date_to))
+    rollups.delete()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {rollup} ({date}, {store_id}, {product_id}, {units}, {value}) '
+            'SELECT {sale}.{date}, {sale}.{store_id}, {detail}.{product_id}, '
+            'SUM({detail}.{quantity}), SUM({detail}.{value}) '
+            'FROM {detail} INNER JOIN {sale} ON ({detail}.{sale_id} = {sale}.{id}) {where}'
+            'GROUP BY {sale}.{date}, {sale}.{store_id}, {detail}.{product_id}'.format(
+                rollup=qn(DailySale._meta.db_table),
+                sale=sale,
+                detail=qn(SaleDetail._meta.db_table),
+                date=qn('date'),
+                store_id=qn('store_id'),
+                product_id=qn('product_id'),
+                units=qn('units'),
+                value=qn('value'),
+                quantity=qn('quantity'),
+                sale_id=qn('sale_id'),
+                id=qn('id'),
+                where='WHERE {} '.format(' AND '.join(conditions)) if conditions else ''
+            ),
+            params
+        )
+        return cursor.rowcount
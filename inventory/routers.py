@@ -0,0 +1,40 @@
+from django.conf import settings
+
+# models kept in the archive database, by model name
+ARCHIVED = {'archivedsale', 'archivedsaledetail'}
+
+
+def archive_database():
+    """
+    Alias of the archive database, the default database when
+    INVENTORY_ARCHIVE_DATABASE is not configured
+    """
+    alias = settings.INVENTORY_ARCHIVE_DATABASE
+    return alias if alias in settings.DATABASES else 'default'
+
+
+class ArchiveRouter:
+    """
+    Sends the archived sales to the archive database and keeps every other
+    model out of it, so its file only holds cold history
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.model_name in ARCHIVED:
+            return archive_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archive = archive_database()
+        if archive == 'default':
+            return None
+        if app_label == 'inventory' and model_name in ARCHIVED:
+            return db == archive
+        if db == archive:
+            return False
+        return None
@@ -0,0 +1,137 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, IntegerField
+from django.db.models.expressions import RawSQL
+
+from .models import Product, Store
+
+# model and the FTS5 table indexing its name, kept in sync by triggers
+INDEXES = {
+    Product: 'inventory_product_search',
+    Store: 'inventory_store_search',
+}
+RANK = 'rank'
+MATCH_ID = 'match_id'
+TOKEN = re.compile(r'\w+')
+
+installed = {}
+
+
+def available(model):
+    """
+    Whether the model's name index exists on the default database, checked
+    once per process
+    """
+    if connection.vendor != 'sqlite' or model not in INDEXES:
+        return False
+    if connection.alias not in installed:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (%s, %s)",
+                           list(INDEXES.values()))
+            installed[connection.alias] = {row[0] for row in cursor.fetchall()}
+    return INDEXES[model] in installed[connection.alias]
+
+
+def match_query(terms):
+    """
+    FTS5 query matching rows holding every word of `terms`, the last word of
+    each term as a prefix. Words are quoted, so no search text can inject
+    FTS5 operators.
+    """
+    tokens = [token for term in terms for token in TOKEN.findall(term)]
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(queryset, terms):
+    """
+    Rows of `queryset` whose name matches `terms`, annotated with their bm25
+    `rank` (lower is more relevant) and ordered by it.
+
+    Ranking scores every match, so a query matching more than
+    INVENTORY_SEARCH_RANK_LIMIT rows (a one or two letter prefix over a large
+    catalog) is returned unranked, ordered by the `match_id` annotation, the
+    id as read from the index, which the index answers page by page.
+    """
+    query = match_query(terms)
+    if not query:
+        return queryset
+    qn = connection.ops.quote_name
+    table = qn(INDEXES[queryset.model])
+    id_column = f'{qn(queryset.model._meta.db_table)}.{qn("id")}'
+    limit = settings.INVENTORY_SEARCH_RANK_LIMIT
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {table} MATCH %s LIMIT %s)',
+                       [query, limit + 1])
+        ranked = cursor.fetchone()[0] <= limit
+    matches = queryset.extra(
+        tables=[INDEXES[queryset.model]],
+        where=[f'{table} MATCH %s', f'{table}.rowid = {id_column}'],
+        params=[query],
+    )
+    if not ranked:
+        return matches.annotate(**{MATCH_ID: RawSQL(f'{table}.rowid', (), output_field=IntegerField())}) \
+            .order_by(MATCH_ID)
+    return matches.annotate(**{RANK: RawSQL(f'{table}.{qn(RANK)}', (), output_field=FloatField())}) \
+        .order_by(RANK, 'id')
+
+
+def matching(queryset, terms):
+    """
+    Rows of `queryset` whose name matches `terms`, unranked, to be used as a
+    subquery (`product__in=matching(...)`). The index is read through an IN
+    on the unqualified id, which stays valid when Django aliases the table.
+    """
+    qn = connection.ops.quote_name
+    table = qn(INDEXES[queryset.model])
+    return queryset.extra(
+        where=[f'{qn("id")} IN (SELECT rowid FROM {table} WHERE {table} MATCH %s)'],
+        params=[match_query(terms)],
+    )
+
+
+def install(using_connection):
+    """
+    Create the FTS5 tables and their triggers when missing, indexing the
+    rows already stored. Safe to run on every migrate.
+    """
+    if using_connection.vendor != 'sqlite':
+        return
+    qn = using_connection.ops.quote_name
+    with using_connection.cursor() as cursor:
+        for model, index in INDEXES.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [index])
+            if cursor.fetchone():
+                continue
+            table = qn(model._meta.db_table)
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {qn(index)} USING fts5(name, content={table}, content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 1', prefix='2 3')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {qn(index + '_insert')} AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {qn(index)}(rowid, name) VALUES (new.id, new.name); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {qn(index + '_delete')} AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {qn(index)}({qn(index)}, rowid, name) VALUES ('delete', old.id, old.name); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER {qn(index + '_update')} AFTER UPDATE OF name ON {table} BEGIN "
+                f"INSERT INTO {qn(index)}({qn(index)}, rowid, name) VALUES ('delete', old.id, old.name); "
+                f"INSERT INTO {qn(index)}(rowid, name) VALUES (new.id, new.name); END"
+            )
+            cursor.execute(f"INSERT INTO {qn(index)}({qn(index)}) VALUES ('rebuild')")
+    installed.pop(using_connection.alias, None)
+
+
+def rebuild(using_connection):
+    """
+    Reindex every name from the content tables, then merge the index segments
+    """
+    qn = using_connection.ops.quote_name
+    with using_connection.cursor() as cursor:
+        for index in INDEXES.values():
+            cursor.execute(f"INSERT INTO {qn(index)}({qn(index)}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {qn(index)}({qn(index)}) VALUES ('optimize')")
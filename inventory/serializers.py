@@ -1,21 +1,94 @@
-from rest_framework import serializers
+import json
+from collections import Counter
+
+from rest_framework import exceptions, serializers, status
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import get_object_or_404, get_list_or_404
 from django.db import transaction
+from django.http import Http404
 
+from . import catalog, fieldsets, ledger, logs, rollups
 from .models import *
+from .stock import InsufficientStock
 
 import logging
 logger = logging.getLogger(__name__)
 
+# largest quantity of a sale line, the column is a small integer
+QUANTITY_MAX = 32767
+
+
+def shortage_errors(shortages):
+    return [
+        {
+            'product_id': shortage['product'],
+            'requested': shortage['requested'],
+            'available': shortage['available'],
+            'error': _('product not inventory in this store') if shortage['available'] is None
+            else _('insufficient stock'),
+        }
+        for shortage in shortages
+    ]
+
+
+class StockShortage(exceptions.APIException):
+    """
+    400 response listing the short lines under `field`. ValidationError would
+    turn the quantities into strings and a missing row into "None".
+    """
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_code = 'insufficient_stock'
+
+    def __init__(self, field, shortages):
+        self.detail = {field: shortage_errors(shortages)}
+
 
-class StoreSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets on GET: `?fields=a,b` keeps only those fields, `?omit=a,b`
+    drops them and related objects are rendered as their id unless named in
+    `?expand=a,b`. Without any of them the full representation is returned,
+    a name the serializer doesn't have is a validation error.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        sparse = fieldsets.sparse_fields(self.context.get('request'))
+        if sparse is None or not self.is_root():
+            return fields
+        only, omit, expand = sparse
+        unknown = {
+            parameter: [_('unknown fields: %(names)s') % {'names': ', '.join(sorted(names - set(fields)))}]
+            for parameter, names in zip(fieldsets.PARAMETERS, sparse) if names - set(fields)
+        }
+        if unknown:
+            raise serializers.ValidationError(unknown)
+        for name in list(fields):
+            if (only and name not in only) or name in omit:
+                del fields[name]
+        for name, field in fields.items():
+            if name in expand or field.write_only or not isinstance(field, serializers.BaseSerializer) \
+                    or isinstance(field, serializers.ListSerializer):
+                continue
+            kwargs = {'source': field.source} if field.source and field.source != name else {}
+            fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+        return fields
+
+    def is_root(self):
+        # nested serializers share the root's request, the parameters only name its fields
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+class StoreSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Store
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
@@ -25,7 +98,7 @@ class ProductSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(_('price cannot be less than or equals zero'))
 
 
-class InventorySerializer(serializers.ModelSerializer):
+class InventorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     store = StoreSerializer()
     product = ProductSerializer()
 
@@ -43,7 +116,83 @@ class InventorySerializer(serializers.ModelSerializer):
         return ret
 
 
-class SaleDetailSerializer(serializers.ModelSerializer):
+class InventoryFlatSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    store_name = serializers.CharField(source='store.name', read_only=True)
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product_unit = serializers.CharField(source='product.unit', read_only=True)
+
+    class Meta:
+        model = Inventory
+        fields = ['id', 'store', 'store_name', 'product', 'product_name', 'product_unit', 'available',
+                  'reorder_point', 'date_lst']
+
+
+class StockSerializer(InventoryFlatSerializer):
+    pending = serializers.IntegerField(read_only=True)
+    stock = serializers.IntegerField(read_only=True)
+
+    class Meta(InventoryFlatSerializer.Meta):
+        fields = InventoryFlatSerializer.Meta.fields + ['pending', 'stock']
+
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockMovement
+        fields = '__all__'
+
+
+class StockTransferSerializer(serializers.ModelSerializer):
+    """
+    Stock transfer between two stores, posted with its lines
+    [{"product_id": 1, "quantity": 2}, ...]; the lines of a product are added up
+    """
+    items = serializers.ListField(child=serializers.DictField(), write_only=True, allow_empty=False)
+
+    class Meta:
+        model = StockTransfer
+        fields = ['id', 'source', 'target', 'items', 'lines', 'units', 'date']
+        read_only_fields = ['lines', 'units']
+
+    def validate_items(self, items):
+        # parsed by hand, a nested serializer per line is the slow part of a transfer of thousands of lines
+        quantities = Counter()
+        for item in items:
+            try:
+                product_id = int(item.get('product_id'))
+                quantity = int(item.get('quantity'))
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(_('product_id and quantity must be valid integers'))
+            if quantity <= 0:
+                raise serializers.ValidationError(_('quantity must be greater than zero'))
+            quantities[product_id] += quantity
+        missing = sorted(set(quantities) - set(catalog.get_products(set(quantities))))
+        if missing:
+            raise serializers.ValidationError(_('products %(ids)s not found') % {
+                'ids': ', '.join(str(product_id) for product_id in missing)
+            })
+        return quantities
+
+    def validate(self, data):
+        if data['source'] == data['target']:
+            raise serializers.ValidationError({'target': _('target must be another store')})
+        return data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        quantities = validated_data.pop('items')
+        stock_transfer = StockTransfer.objects.create(
+            lines=len(quantities), units=sum(quantities.values()), **validated_data
+        )
+        try:
+            ledger.transfer(stock_transfer, quantities)
+        except InsufficientStock as error:
+            raise StockShortage('items', error.shortages)
+        logger.info('transfer %s store %s to store %s', stock_transfer.id, stock_transfer.source_id,
+                    stock_transfer.target_id, extra=logs.fields(lines=stock_transfer.lines, units=stock_transfer.units))
+        return stock_transfer
+
+
+class SaleDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = SaleDetail
         fields = '__all__'
@@ -54,33 +203,69 @@ class SaleDetailSerializer(serializers.ModelSerializer):
         if not product_id:
             return super().to_internal_value(data)
 
+        errors = {}
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            errors['product_id'] = _('a valid integer is required')
         quantity = data.get('quantity')
-        if not quantity:
-            raise serializers.ValidationError({'quantity': _('This field is required')})
-        product = get_object_or_404(Product, id=product_id)
-
+        if quantity in (None, ''):
+            errors['quantity'] = _('This field is required')
+        else:
+            try:
+                quantity = int(quantity)
+            except (TypeError, ValueError):
+                errors['quantity'] = _('a valid integer is required')
+            else:
+                if quantity <= 0:
+                    errors['quantity'] = _('quantity must be greater than zero')
+                elif quantity > QUANTITY_MAX:
+                    errors['quantity'] = _('quantity cannot be greater than %(max)s') % {'max': QUANTITY_MAX}
         value = data.get('value')
-        if not value:
-            value = product.price * quantity
+        if value not in (None, ''):
+            try:
+                value = line_value().run_validation(value)
+            except serializers.ValidationError as error:
+                errors['value'] = error.detail
+        if errors:
+            raise serializers.ValidationError(errors)
 
+        # the product is resolved by SaleSerializer from the catalog cache for the whole ticket
         return {
-            'product': product,
+            'product_id': product_id,
             'quantity': quantity,
             'value': value
         }
 
 
-class SaleSerializer(serializers.ModelSerializer):
+def line_value():
+    """
+    Field validating the `value` of a sale line against its column, a sale can't be worth less than zero
+    """
+    field = SaleDetail._meta.get_field('value')
+    return serializers.DecimalField(max_digits=field.max_digits, decimal_places=field.decimal_places, min_value=0)
+
+
+class SaleLineSerializer(serializers.ModelSerializer):
+    sale_id = serializers.IntegerField(read_only=True)
+    product_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SaleDetail
+        fields = ['id', 'sale_id', 'product_id', 'quantity', 'value', 'date_lst']
+
+
+class SaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     details = SaleDetailSerializer(many=True, write_only=True)
     # store = StoreSerializer(many=True)
 
     class Meta:
         model = Sale
-        fields = ['number', 'store', 'details']
+        fields = ['id', 'number', 'store', 'date', 'details']
         depth = 1
 
     def to_internal_value(self, data):
-        logger.info(f"data to_internal: {data}")
+        logger.debug('sale payload received', extra=logs.sampled(payload=data))
         details = data.get('details', None)
         store = data.get('store')
         if not store:
@@ -90,37 +275,95 @@ class SaleSerializer(serializers.ModelSerializer):
         if len(details) == 0:
             raise serializers.ValidationError({'details': _('this field is empty')})
         data = super().to_internal_value(data)
-        data.update({'store': get_object_or_404(Store, id=store)})
+        try:
+            store = catalog.get_store(int(store))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'store': _('a valid integer is required')})
+        if store is None:
+            raise Http404(_('store not found'))
+        data.update({
+            'store': store,
+            'details': self.resolve_details(data['details']),
+        })
         return data
 
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        lst = []
-        details = SaleDetail.objects.filter(sale_id=instance.id).values()
+    def resolve_details(self, details):
+        products = catalog.get_products({detail['product_id'] for detail in details})
+        resolved = []
         for detail in details:
-            lst.append(detail)
+            product = products.get(detail['product_id'])
+            if product is None:
+                raise Http404(_('product %(id)s not found') % {'id': detail['product_id']})
+            value = detail['value']
+            if not value:
+                value = product.price * detail['quantity']
+            resolved.append({
+                'product': product,
+                'quantity': detail['quantity'],
+                'value': value
+            })
+        return resolved
 
-        data.update({'details': lst})
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'details' not in self.fields:
+            return data
+        # uses the details prefetched by SaleViewSet, one query per sale otherwise
+        data.update({'details': SaleLineSerializer(instance.saledetail_set.all(), many=True).data})
         return data
 
     @transaction.atomic
     def create(self, validated_data):
         details = validated_data.pop('details')
+        store = validated_data['store']
         sale = Sale.objects.create(**validated_data)
-        for detail in details:
-            try:
-                inventory = Inventory.objects.get(store=validated_data['store'], product=detail['product'])
-            except Inventory.DoesNotExist:
-                sale.delete()
-                logger.error(f"product {detail['product']} in store {validated_data['store']} not inventory")
-                transaction.set_rollback(True)
-                logger.error(f"Rollback transaction")
-                raise serializers.ValidationError({'error', _('product not inventory in this store')})
-            else:
-                SaleDetail.objects.create(sale=sale, **detail)
-                inventory.available -= 1
-                logger.info(f"{detail['product']} {validated_data['store']} new balance {inventory.available}")
-                inventory.save()
+        SaleDetail.objects.bulk_create([SaleDetail(sale=sale, **detail) for detail in details])
+        try:
+            ledger.sell((sale.id, store.id, detail['product'].id, detail['quantity']) for detail in details)
+        except InsufficientStock as error:
+            logger.error('sale %s store %s short of stock', sale.number, store.id,
+                         extra=logs.fields(sale=sale.id, shortages=error.shortages))
+            raise StockShortage('details', error.shortages)
+        rollups.record_sales(sale.date, [
+            (store.id, detail['product'].id, detail['quantity'], detail['value']) for detail in details
+        ])
+        if logger.isEnabledFor(logging.DEBUG):
+            for detail in details:
+                logger.debug('sale line discounted', extra=logs.sampled(
+                    sale=sale.id, product=detail['product'].id, quantity=detail['quantity'], value=detail['value']
+                ))
+        logger.info('sale %s store %s discounted', sale.number, store.id,
+                    extra=logs.fields(sale=sale.id, lines=len(details), units=sum(detail['quantity'] for detail in details)))
         return sale
 
 
+class SaleHistorySerializer(serializers.Serializer):
+    """
+    Sale of the default or the archive database, `archived` tells which
+    """
+    id = serializers.IntegerField(read_only=True)
+    number = serializers.CharField(read_only=True)
+    store = serializers.IntegerField(source='store_id', read_only=True)
+    date = serializers.DateField(read_only=True)
+    archived = serializers.SerializerMethodField()
+    details = SaleLineSerializer(source='saledetail_set', many=True, read_only=True)
+
+    def get_archived(self, instance):
+        return isinstance(instance, ArchivedSale)
+
+
+class DailySaleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySale
+        fields = '__all__'
+
+
+class SaleTicketSerializer(serializers.ModelSerializer):
+    errors = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SaleOutbox
+        fields = ['ticket', 'number', 'store', 'status', 'sale', 'errors', 'date', 'date_lst']
+
+    def get_errors(self, instance):
+        return json.loads(instance.errors) if instance.errors else None
@@ -0,0 +1,35 @@
+from django.db.backends.signals import connection_created
+from django.db import connections, router
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import catalog, db, search, snapshots
+from .models import Store, Product, Inventory
+
+
+@receiver([post_save, post_delete], sender=Inventory)
+def inventory_changed(sender, instance, **kwargs):
+    snapshots.invalidate_store(instance.store_id)
+
+
+@receiver([post_save, post_delete], sender=Store)
+def store_changed(sender, instance, **kwargs):
+    catalog.invalidate_store(instance.id)
+    snapshots.invalidate_store(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    catalog.invalidate_product(instance.id)
+    snapshots.invalidate_all()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    db.configure_sqlite(connection)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    if sender.name == 'inventory' and router.allow_migrate_model(using, Product):
+        search.install(connections[using])
@@ -0,0 +1,84 @@
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import Inventory
+
+VERSION_KEY = 'inventory:snapshot:version'
+STORE_VERSION_KEY = 'inventory:snapshot:version:{store}'
+SNAPSHOT_KEY = 'inventory:snapshot:{store}:{version}:{store_version}:{query}'
+
+
+def cache():
+    return caches[settings.INVENTORY_SNAPSHOT_CACHE]
+
+
+def version(key):
+    return cache().get_or_set(key, 1, None)
+
+
+def bump(key):
+    try:
+        cache().incr(key)
+    except ValueError:
+        cache().set(key, 2, None)
+
+
+def invalidate_store(store_id):
+    """
+    Drop the cached snapshots of a store once the current transaction commits
+    """
+    transaction.on_commit(lambda: bump(STORE_VERSION_KEY.format(store=store_id)))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: bump(VERSION_KEY))
+
+
+def snapshot_key(store_id, request):
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()
+    return SNAPSHOT_KEY.format(
+        store=store_id,
+        version=version(VERSION_KEY),
+        store_version=version(STORE_VERSION_KEY.format(store=store_id)),
+        query=query
+    )
+
+
+def validators(store_id, request):
+    """
+    ETag and Last-Modified of a store snapshot, derived from the `date_lst` of
+    its inventory rows and of the stores and products they embed
+    """
+    stats = Inventory.objects.filter(store_id=store_id).aggregate(
+        rows=Count('id'),
+        inventory=Max('date_lst'),
+        store=Max('store__date_lst'),
+        product=Max('product__date_lst')
+    )
+    dates = [stats[name] for name in ('inventory', 'store', 'product') if stats[name] is not None]
+    last_modified = calendar.timegm(max(dates).utctimetuple()) if dates else None
+    tag = '{}:{}:{}:{}'.format(
+        store_id,
+        stats['rows'],
+        max(dates).isoformat() if dates else '',
+        request.META.get('QUERY_STRING', '')
+    )
+    return quote_etag(hashlib.md5(tag.encode()).hexdigest()), last_modified
+
+
+def not_modified(request, snapshot):
+    return get_conditional_response(request, etag=snapshot['etag'], last_modified=snapshot['last_modified'])
+
+
+def set_validators(response, snapshot):
+    response['ETag'] = snapshot['etag']
+    if snapshot['last_modified'] is not None:
+        response['Last-Modified'] = http_date(snapshot['last_modified'])
+    return response
@@ -0,0 +1,220 @@
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from . import snapshots
+from .models import Inventory
+from .upserts import upsert
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when one or more (store, product) lines cannot be decremented.
+
+    `shortages` holds one dict per short line with the requested quantity and
+    the quantity available, `None` when the product is not stocked in the store.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(shortages)
+
+
+class _Short(Exception):
+    pass
+
+
+def aggregate(lines):
+    """
+    Sum an iterable of (store_id, product_id, quantity) into a Counter keyed
+    by (store_id, product_id)
+    """
+    quantities = Counter()
+    for store_id, product_id, quantity in lines:
+        quantities[(store_id, product_id)] += quantity
+    return quantities
+
+
+def inventory_rows(keys):
+    """
+    Inventory queryset matching a collection of (store_id, product_id) keys
+    """
+    products = {}
+    for store_id, product_id in keys:
+        products.setdefault(store_id, []).append(product_id)
+    condition = Q()
+    for store_id, product_ids in products.items():
+        condition |= Q(store_id=store_id, product_id__in=product_ids)
+    return Inventory.objects.filter(condition)
+
+
+def lock_rows(keys):
+    """
+    Take row locks in a deterministic (store, product) order so concurrent
+    multi-line operations cannot deadlock each other. Backends without
+    SELECT ... FOR UPDATE (SQLite) have one lock for the whole database, a
+    transaction reading the stock before its first write takes it with
+    `write_lock`.
+    """
+    if connection.features.has_select_for_update:
+        list(inventory_rows(keys).select_for_update().order_by('store_id', 'product_id').values_list('pk', flat=True))
+
+
+def write_lock():
+    """
+    On SQLite take the database write lock with a no-op write, before the
+    transaction reads the stock. A transaction that reads first and then
+    writes fails with "database is locked" as soon as another writer commits
+    in between, busy_timeout only makes a transaction that has not read yet
+    wait for the lock. Must be the first statement of the transaction, other
+    backends lock rows and do nothing here.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE {table} SET {id} = {id} WHERE 0'.format(
+            table=qn(Inventory._meta.db_table), id=qn('id')))
+
+
+def batches(keys, params_per_key):
+    """
+    Split sorted keys so a statement never exceeds the backend parameter limit
+    """
+    limit = connection.features.max_query_params
+    size = max(1, (limit - 1) // params_per_key) if limit else len(keys)
+    for start in range(0, len(keys), size):
+        yield keys[start:start + size]
+
+
+def shortages(quantities, available):
+    """
+    Lines of `quantities` that `available`, a mapping of (store_id,
+    product_id) to units, cannot cover, in the InsufficientStock format
+    """
+    return [
+        {
+            'store': store_id,
+            'product': product_id,
+            'requested': quantity,
+            'available': available.get((store_id, product_id)),
+        }
+        for (store_id, product_id), quantity in sorted(quantities.items())
+        if (available.get((store_id, product_id)) or 0) < quantity
+    ]
+
+
+def decrement_stock(quantities):
+    """
+    Discount `quantities`, a mapping of (store_id, product_id) to units, with
+    conditional UPDATEs that only touch rows holding enough stock. Either every
+    line is applied or none is and InsufficientStock reports the short lines.
+    Must run inside a transaction.
+    """
+    if not quantities:
+        return
+    keys = sorted(quantities)
+    lock_rows(keys)
+    now = Inventory._meta.get_field('date_lst').get_db_prep_value(timezone.now(), connection)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            updated = 0
+            for batch in batches(keys, 8):
+                sql, params = conditional_update_sql(batch, quantities, now)
+                cursor.execute(sql, params)
+                updated += cursor.rowcount
+            if updated != len(keys):
+                raise _Short()
+    except _Short:
+        available = {
+            (store_id, product_id): value
+            for store_id, product_id, value in
+            inventory_rows(keys).values_list('store_id', 'product_id', 'available')
+        }
+        raise InsufficientStock(shortages(quantities, available))
+    for store_id in {store_id for store_id, product_id in keys}:
+        snapshots.invalidate_store(store_id)
+
+
+def increment_stock(quantities):
+    """
+    Add `quantities`, a mapping of (store_id, product_id) to units, creating
+    the inventory rows the stores do not have yet, with one prepared upsert
+    """
+    if not quantities:
+        return
+    keys = sorted(quantities)
+    now = Inventory._meta.get_field('date_lst').get_db_prep_value(timezone.now(), connection)
+    qn = connection.ops.quote_name
+    upsert(Inventory, ['store_id', 'product_id', 'available', 'date_lst'], ['store_id', 'product_id'], [
+        (store_id, product_id, quantities[store_id, product_id], now) for store_id, product_id in keys
+    ], update={
+        'available': f"{qn(Inventory._meta.db_table)}.{qn('available')} + excluded.{qn('available')}",
+        'date_lst': f"excluded.{qn('date_lst')}",
+    })
+    for store_id in {store_id for store_id, product_id in keys}:
+        snapshots.invalidate_store(store_id)
+
+
+def conditional_update_sql(keys, quantities, now):
+    """
+    UPDATE discounting each (store, product) key by its quantity, guarded by
+    available >= quantity. Built by hand because a Case/When with hundreds of
+    branches is far more expensive to compile through the ORM than to run.
+    """
+    qn = connection.ops.quote_name
+    products = {}
+    for store_id, product_id in keys:
+        products.setdefault(store_id, []).append(product_id)
+
+    case_sql = []
+    case_params = []
+    where_sql = []
+    where_params = []
+    for store_id, product_ids in products.items():
+        case_sql.append('WHEN %s THEN CASE {product} {whens} END'.format(
+            product=qn('product_id'),
+            whens=' '.join(['WHEN %s THEN %s'] * len(product_ids))
+        ))
+        case_params.append(store_id)
+        for product_id in product_ids:
+            case_params.extend([product_id, quantities[store_id, product_id]])
+        where_sql.append('({store} = %s AND {product} IN ({ids}))'.format(
+            store=qn('store_id'),
+            product=qn('product_id'),
+            ids=', '.join(['%s'] * len(product_ids))
+        ))
+        where_params.append(store_id)
+        where_params.extend(product_ids)
+
+    case = 'CASE {store} {whens} END'.format(store=qn('store_id'), whens=' '.join(case_sql))
+    sql = 'UPDATE {table} SET {available} = {available} - {case}, {date_lst} = %s ' \
+          'WHERE ({where}) AND {available} >= {case}'.format(
+              table=qn(Inventory._meta.db_table),
+              available=qn('available'),
+              date_lst=qn('date_lst'),
+              case=case,
+              where=' OR '.join(where_sql)
+          )
+    return sql, case_params + [now] + where_params + case_params
+
+
+def low_stock(threshold, store_id=None):
+    """
+    Inventory rows at or below their reorder point, or at or below `threshold`
+    when they have none. For one store the scan is bounded by the highest
+    threshold in use so it is a range over the (store, available) index.
+    Across stores the rows without and with a reorder point are read as two
+    branches of the (reorder_point, available) index, the OR of both would
+    scan the table.
+    """
+    if store_id is not None:
+        highest = Inventory.objects.aggregate(highest=Max('reorder_point'))['highest'] or 0
+        return Inventory.objects.filter(store_id=store_id, available__lte=max(threshold, highest)).filter(
+            Q(reorder_point__isnull=True, available__lte=threshold) | Q(available__lte=F('reorder_point'))
+        )
+    default = Inventory.objects.filter(reorder_point__isnull=True, available__lte=threshold)
+    own = Inventory.objects.filter(reorder_point__isnull=False, available__lte=F('reorder_point'))
+    return Inventory.objects.filter(id__in=default.order_by().values('id').union(own.order_by().values('id'), all=True))
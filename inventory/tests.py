@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from . import archive, benchmark, bulk, catalog, ledger, logs, metrics, outbox, receiving, rollups
+from .models import Store, Product, Inventory, Sale, SaleDetail, DailySale, SaleOutbox, StockMovement, StockTransfer, \
+    ArchivedSale, ArchivedSaleDetail
+from .stock import InsufficientStock, decrement_stock
+
+
+class InventoryTestMixin:
+
+    def setUp(self):
+        cache.clear()
+        catalog.clear()
+        self.user = User.objects.create_superuser('test', 'test@example.com', 'test')
+        self.client.force_authenticate(self.user)
+        self.store = Store.objects.create(name='Main')
+
+    def stock(self, count, available=100):
+        Product.objects.bulk_create([
+            Product(name=f'product {i}', unit=Product.UNIT_UNITY, price=Decimal('10.00'))
+            for i in range(count)
+        ])
+        products = list(Product.objects.order_by('-id')[:count])[::-1]
+        Inventory.objects.bulk_create([
+            Inventory(store=self.store, product=product, available=available)
+            for product in products
+        ])
+        return products
+
+    def sell(self, products, quantity=1, number='1'):
+        return self.client.post('/v1/api/sale/', {
+            'number': number,
+            'store': self.store.id,
+            'details': [{'product_id': product.id, 'quantity': quantity} for product in products]
+        }, format='json')
+
+
+class InventoryTestCase(InventoryTestMixin, APITestCase):
+    pass
+
+
+class SaleCreateTests(InventoryTestCase):
+
+    def test_sale_discounts_quantity(self):
+        products = self.stock(2)
+        response = self.sell(products, quantity=3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SaleDetail.objects.count(), 2)
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)),
+            [97, 97]
+        )
+        self.assertEqual(SaleDetail.objects.first().value, Decimal('30.00'))
+
+    def test_sale_without_inventory_is_rolled_back(self):
+        products = self.stock(1)
+        other = Product.objects.create(name='other', unit=Product.UNIT_UNITY, price=Decimal('1.00'))
+        response = self.sell(products + [other])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['details'], [
+            {'product_id': other.id, 'requested': 1, 'available': None, 'error': 'product not inventory in this store'}
+        ])
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(Inventory.objects.get().available, 100)
+
+    def test_short_lines_are_reported_and_nothing_is_discounted(self):
+        products = self.stock(3, available=2)
+        Inventory.objects.filter(product=products[2]).update(available=5)
+        response = self.sell(products, quantity=3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['details'], [
+            {'product_id': products[0].id, 'requested': 3, 'available': 2, 'error': 'insufficient stock'},
+            {'product_id': products[1].id, 'requested': 3, 'available': 2, 'error': 'insufficient stock'},
+        ])
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(Inventory.objects.get(product=products[2]).available, 5)
+
+    def test_invalid_lines_are_reported_per_field(self):
+        product, = self.stock(1)
+        for line, errors in (
+            ({'quantity': 1, 'value': 'abc'}, ['value']),
+            ({'quantity': 40000}, ['quantity']),
+            ({'quantity': 'two'}, ['quantity']),
+            ({'quantity': 1, 'value': '1' * 20}, ['value']),
+            ({'quantity': 1, 'value': '-5'}, ['value']),
+        ):
+            response = self.client.post('/v1/api/sale/', {
+                'number': '1', 'store': self.store.id, 'details': [dict(line, product_id=product.id)]
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['details'][0]), errors)
+        self.assertEqual(self.client.post('/v1/api/sale/', {
+            'number': '1', 'store': self.store.id, 'details': [{'product_id': product.id, 'quantity': 2, 'value': '15.5'}]
+        }, format='json').status_code, 201)
+        self.assertEqual(SaleDetail.objects.get().value, Decimal('15.50'))
+
+    def test_query_count_does_not_depend_on_ticket_size(self):
+        products = self.stock(100)
+        for size in (1, 10, 100):
+            catalog.clear()
+            with self.assertNumQueries(13):
+                response = self.sell(products[:size], number=str(size))
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Inventory.objects.filter(available=99).count(), 90)
+
+
+class CatalogTests(InventoryTestCase):
+
+    def test_sale_validation_reads_catalog_from_cache(self):
+        products = self.stock(10)
+        self.sell(products, number='1')
+        with self.assertNumQueries(11):
+            self.sell(products, number='2')
+        self.assertEqual(catalog.stats()['products']['hits'], 10)
+
+    def test_product_save_invalidates_cache(self):
+        product = self.stock(1)[0]
+        catalog.get_products([product.id])
+        product.price = Decimal('20.00')
+        product.save()
+        self.assertEqual(catalog.get_products([product.id])[product.id].price, Decimal('20.00'))
+
+
+class ConcurrentDecrementTests(InventoryTestMixin, APITransactionTestCase):
+
+    def test_concurrent_sales_do_not_lose_updates(self):
+        products = self.stock(3, available=50)
+        keys = [(self.store.id, product.id) for product in products]
+        sold = []
+        errors = []
+
+        def register(worker):
+            try:
+                for i in range(20):
+                    # each worker sells the lines in a different order
+                    lines = {key: 1 + (i + worker) % 2 for key in keys[worker % 3:] + keys[:worker % 3]}
+                    try:
+                        with transaction.atomic():
+                            decrement_stock(lines)
+                    except InsufficientStock:
+                        break
+                    sold.append(lines)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(worker,)) for worker in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for key in keys:
+            units = sum(lines[key] for lines in sold)
+            self.assertEqual(Inventory.objects.get(store_id=key[0], product_id=key[1]).available, 50 - units)
+
+
+class ConcurrentBulkSaleTests(InventoryTestMixin, APITransactionTestCase):
+
+    def test_concurrent_uploads_wait_for_the_write_lock(self):
+        products = self.stock(3, available=1000)
+        results = []
+        errors = []
+
+        def register(worker):
+            try:
+                for i in range(10):
+                    results.extend(bulk.ingest_sales([
+                        {'number': f'{worker}-{i}-{n}', 'store': self.store.id,
+                         'details': [{'product_id': product.id, 'quantity': 1} for product in products]}
+                        for n in range(3)
+                    ], chunk_size=3))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(worker,)) for worker in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual({result['status'] for result in results}, {bulk.CREATED})
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)), [820] * 3
+        )
+
+
+    @override_settings(INVENTORY_STOCK_DEFERRED=True)
+    def test_compaction_waits_for_the_write_lock(self):
+        products = self.stock(3, available=1000)
+        errors = []
+        done = threading.Event()
+
+        def register(worker):
+            try:
+                for i in range(10):
+                    bulk.ingest_sales([
+                        {'number': f'{worker}-{i}-{n}', 'store': self.store.id,
+                         'details': [{'product_id': product.id, 'quantity': 1} for product in products]}
+                        for n in range(3)
+                    ], chunk_size=3)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def compact():
+            try:
+                while not done.is_set():
+                    ledger.compact()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        compactor = threading.Thread(target=compact)
+        compactor.start()
+        threads = [threading.Thread(target=register, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        compactor.join()
+
+        self.assertEqual(errors, [])
+        ledger.compact()
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)), [880] * 3
+        )
+
+class BulkSaleTests(InventoryTestCase):
+
+    def test_bulk_upload_reports_every_sale(self):
+        products = self.stock(2, available=5)
+        sales = [
+            {'number': '1', 'store': self.store.id, 'details': [{'product_id': products[0].id, 'quantity': 3}]},
+            {'number': '2', 'store': 999, 'details': [{'product_id': products[0].id, 'quantity': 1}]},
+            {'number': '3', 'store': self.store.id, 'details': [{'product_id': products[0].id, 'quantity': 3}]},
+            {'number': '4', 'store': self.store.id, 'details': [
+                {'product_id': products[0].id, 'quantity': 2},
+                {'product_id': products[1].id, 'quantity': 5},
+            ]},
+        ]
+        response = self.client.post('/v1/api/sale/bulk/?chunk_size=3', sales, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.data],
+            ['created', 'rejected', 'rejected', 'created']
+        )
+        self.assertIn('store', response.data[1]['errors'])
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)),
+            [0, 0]
+        )
+
+    def test_bulk_upload_accepts_ndjson(self):
+        products = self.stock(1)
+        body = '\n'.join([
+            '{"number": "1", "store": %d, "details": [{"product_id": %d, "quantity": 1}]}' % (
+                self.store.id, products[0].id),
+            '{not json',
+        ])
+        response = self.client.post('/v1/api/sale/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data], ['created', 'rejected'])
+        self.assertEqual(Inventory.objects.get().available, 99)
+
+
+    def test_bulk_upload_requires_a_list(self):
+        for body in ('{"number": "1"}', '"1"', '1', 'null'):
+            response = self.client.post('/v1/api/sale/bulk/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('non_field_errors', response.data)
+
+    def test_bulk_upload_validates_line_values_and_quantities(self):
+        products = self.stock(1)
+        lines = ['{"product_id": %d, "quantity": 1, "value": %s}' % (products[0].id, value)
+                 for value in ('NaN', 'Infinity', '1e30', '-5')]
+        lines.append('{"product_id": %d, "quantity": 40000}' % products[0].id)
+        # NDJSON lines are read with the json module, which accepts NaN and Infinity
+        body = '\n'.join(
+            '{"number": "%d", "store": %d, "details": [%s]}' % (number, self.store.id, line)
+            for number, line in enumerate(lines)
+        )
+        response = self.client.post('/v1/api/sale/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.data], ['rejected'] * 5)
+        self.assertEqual([list(result['errors']['details'][0]) for result in response.data],
+                         [['value']] * 4 + [['quantity']])
+        self.assertIn('32767', str(response.data[4]['errors']['details'][0]['quantity']))
+        self.assertEqual(Inventory.objects.get().available, 100)
+
+class PaginationTests(InventoryTestCase):
+
+    def test_list_is_paginated_by_cursor_without_count(self):
+        self.stock(5)
+        seen = []
+        url = '/v1/api/inventory/?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted(Inventory.objects.values_list('id', flat=True)))
+
+
+class InventoryListTests(InventoryTestCase):
+
+    def test_list_query_count_does_not_depend_on_rows(self):
+        self.stock(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(f'/v1/api/inventory/?store={self.store.id}')
+        expected = len(small)
+        self.stock(20)
+        for flat in ('false', 'true'):
+            with self.assertNumQueries(expected):
+                response = self.client.get(f'/v1/api/inventory/?store={self.store.id}&flat={flat}')
+            self.assertEqual(len(response.data['results']), 22)
+        self.assertEqual(response.data['results'][0]['store_name'], 'Main')
+
+
+class SaleListTests(InventoryTestCase):
+
+    def test_list_loads_details_in_one_query(self):
+        products = self.stock(3)
+        self.sell(products, number='1')
+        with CaptureQueriesContext(connection) as single:
+            self.client.get('/v1/api/sale/')
+        expected = len(single)
+        for number in range(2, 21):
+            self.sell(products, number=str(number))
+        with self.assertNumQueries(expected):
+            response = self.client.get('/v1/api/sale/')
+        self.assertEqual(len(response.data['results']), 20)
+        sale = response.data['results'][0]
+        self.assertEqual(sale['store']['name'], 'Main')
+        self.assertEqual([line['product_id'] for line in sale['details']], [product.id for product in products])
+        self.assertEqual(sale['details'][0]['value'], '10.00')
+
+
+class InventorySnapshotTests(InventoryTestMixin, APITransactionTestCase):
+
+    def test_unchanged_snapshot_is_not_modified_until_a_sale(self):
+        products = self.stock(2)
+        url = f'/v1/api/inventory/?store={self.store.id}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.sell(products[:1])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['available'], 99)
+
+
+class ExportTests(InventoryTestCase):
+
+    def test_sale_details_stream_as_csv_and_ndjson(self):
+        products = self.stock(3)
+        self.sell(products, number='1')
+        response = self.client.get(f'/v1/api/sale-detail/export/csv/?store={self.store.id}')
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'sale_id', 'sale__number'])
+        self.assertEqual(len(lines), 4)
+
+        response = self.client.get('/v1/api/inventory/export/ndjson/?date_from=2000-01-01')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['available'], 99)
+
+        response = self.client.get('/v1/api/sale/export/csv/?date_to=2000-01-01')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(), ['id,number,store_id,date'])
+
+
+class ImportInventoryTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def csv(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf8') as target:
+            target.write(content)
+        return path
+
+    def load(self, *args):
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('import_inventory', '--batch-size', '2', *args, stdout=output, stderr=errors)
+        return output.getvalue(), errors.getvalue()
+
+    def test_inventory_is_upserted_on_store_and_product(self):
+        products = self.stock(2, available=5)
+        path = self.csv('inventory.csv', 'store,product,available\n'
+                                         f'{self.store.id},{products[0].id},7\n'
+                                         f'{self.store.id},{products[1].id},0\n'
+                                         f'{self.store.id},{products[0].id},9\n')
+        output, errors = self.load('--inventory', path)
+        self.assertIn('inventory: 3 rows loaded, 0 rejected', output)
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('product_id', 'available')),
+            [(products[0].id, 9), (products[1].id, 0)]
+        )
+
+    def test_unknown_stores_and_products_are_rejected(self):
+        product, = self.stock(1, available=5)
+        Inventory.objects.all().delete()
+        path = self.csv('inventory.csv', 'store,product,available\n'
+                                         f'{self.store.id},{product.id},3\n'
+                                         f'0,{product.id},3\n'
+                                         f'{self.store.id},0,3\n'
+                                         f'{self.store.id},{product.id},-1\n')
+        output, errors = self.load('--inventory', path)
+        self.assertIn('inventory: 1 rows loaded, 3 rejected', output)
+        self.assertEqual(errors.count('unknown store or product'), 2)
+        self.assertEqual(list(Inventory.objects.values_list('product_id', 'available')), [(product.id, 3)])
+
+    def test_dry_run_rolls_back(self):
+        products = self.csv('products.csv', 'name,unit,price\nrice,gr,5.00\nbeans,gr,4.00\nsoap,und,2.50\n')
+        output, errors = self.load('--products', products, '--dry-run')
+        self.assertIn('products: 3 rows loaded', output)
+        self.assertIn('dry run, nothing was saved', output)
+        self.assertFalse(Product.objects.exists())
+
+
+class DailySaleTests(InventoryTestCase):
+    databases = {'default', 'archive'}
+
+    def test_sales_are_rolled_up_per_store_product_and_day(self):
+        products = self.stock(2)
+        self.sell(products, quantity=2, number='1')
+        self.sell(products[:1], quantity=3, number='2')
+        self.client.post('/v1/api/sale/bulk/', [
+            {'number': '3', 'store': self.store.id, 'details': [{'product_id': products[1].id, 'quantity': 1}]}
+        ], format='json')
+        response = self.client.get(f'/v1/api/report/daily-sales/?store={self.store.id}&product={products[0].id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['units'], row['value']) for row in response.data['results']],
+            [(5, '50.00')]
+        )
+        expected = list(DailySale.objects.order_by('product_id').values_list('product_id', 'units', 'value'))
+        rollups.rebuild()
+        self.assertEqual(list(DailySale.objects.order_by('product_id').values_list('product_id', 'units', 'value')),
+                         expected)
+        self.assertEqual([units for product, units, value in expected], [5, 3])
+
+
+class LowStockTests(InventoryTestCase):
+
+    def test_low_stock_uses_threshold_and_reorder_points(self):
+        products = self.stock(4)
+        for product, available, reorder_point in zip(products, [2, 8, 8, 20], [None, None, 10, 5]):
+            Inventory.objects.filter(product=product).update(available=available, reorder_point=reorder_point)
+        response = self.client.get(f'/v1/api/inventory/low-stock/?store={self.store.id}&threshold=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['product'] for row in response.data['results']], [products[0].id, products[2].id])
+        response = self.client.get('/v1/api/inventory/low-stock/?threshold=8')
+        self.assertEqual(len(response.data['results']), 3)
+
+    @override_settings(INVENTORY_STOCK_DEFERRED=True)
+    def test_deferred_low_stock_counts_pending_movements(self):
+        sold, received = self.stock(2, available=5)
+        Inventory.objects.filter(product=received).update(available=1)
+        self.sell([sold], quantity=4)
+        self.client.post('/v1/api/inventory/receive/', [
+            {'store': self.store.id, 'product': received.id, 'quantity': 10}
+        ], format='json')
+        for query in ('threshold=2', f'threshold=2&store={self.store.id}'):
+            response = self.client.get(f'/v1/api/inventory/low-stock/?{query}')
+            self.assertEqual([(row['product'], row['available'], row['stock']) for row in response.data['results']],
+                             [(sold.id, 5, 1)])
+
+    def test_invalid_parameters_are_reported_under_their_name(self):
+        for query, name in (('store=abc', 'store'), ('threshold=abc', 'threshold')):
+            response = self.client.get(f'/v1/api/inventory/low-stock/?{query}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()), [name])
+
+
+class IdempotencyTests(InventoryTestCase):
+
+    def test_retried_sale_is_not_recorded_twice(self):
+        products = self.stock(2)
+        first = self.sell(products, number='7')
+        with self.assertNumQueries(2):
+            retry = self.sell(products, number='7')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Inventory.objects.filter(available=99).count(), 2)
+
+    def test_idempotency_key_replays_response(self):
+        products = self.stock(1)
+        payload = {'number': '8', 'store': self.store.id, 'details': [{'product_id': products[0].id, 'quantity': 1}]}
+        first = self.client.post('/v1/api/sale/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        with self.assertNumQueries(0):
+            retry = self.client.post('/v1/api/sale/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_bulk_upload_skips_recorded_sales(self):
+        products = self.stock(1)
+        self.sell(products, number='1')
+        sale = {'number': '1', 'store': self.store.id, 'details': [{'product_id': products[0].id, 'quantity': 1}]}
+        response = self.client.post('/v1/api/sale/bulk/', [sale, dict(sale, number='2'), dict(sale, number='2')],
+                                    format='json')
+        self.assertEqual([result['status'] for result in response.data], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(Inventory.objects.get().available, 98)
+
+
+class MetricsTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def test_requests_are_timed_and_exported(self):
+        products = self.stock(1)
+        response = self.sell(products)
+        self.assertRegex(response['Server-Timing'], r'^db;desc="\d+ queries";dur=[\d.]+, app;dur=[\d.]+, ')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('inventory_http_requests_total{view="sale-list",method="POST",status="201"} 1', body)
+        self.assertIn('inventory_http_request_duration_seconds_bucket{view="sale-list",method="POST",status="201",'
+                      'le="+Inf"} 1', body)
+        self.assertRegex(body, r'inventory_sql_queries_total\{view="sale-list",method="POST",status="201"\} [1-9]')
+
+    @override_settings(INVENTORY_METRICS_TOKEN='secret')
+    def test_only_allowed_addresses_and_the_token_are_answered(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5',
+                                         HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5',
+                                         HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(INVENTORY_METRICS_ENABLED=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        response = self.client.get('/v1/api/store/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('inventory_http_requests_total{', self.client.get('/metrics').content.decode())
+
+
+class BenchmarkTests(InventoryTestCase):
+    databases = {'default', 'archive'}
+
+    def test_run_reports_every_scenario(self):
+        data = benchmark.seed(stores=2, products=10, sales=20)
+        report = {'scenarios': benchmark.run(data, requests=5)}
+        self.assertEqual(list(report['scenarios']), list(benchmark.SCENARIOS))
+        for result in report['scenarios'].values():
+            self.assertEqual(result['requests'], 5)
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+        self.assertEqual(Sale.objects.filter(number__startswith='b').count(), 5)
+        self.assertEqual(Sale.objects.filter(number__startswith='m').count(), 2)
+        # two single sales and two bulk uploads of five
+        self.assertEqual(Sale.objects.filter(number__startswith='w').count(), 12)
+        self.assertEqual(benchmark.regressions(report, report, threshold=0), [])
+
+    def test_regressions_beyond_threshold(self):
+        baseline = {'scenarios': {'sale-list': {
+            'requests': 10, 'errors': 0, 'throughput': 100.0, 'p50': 10.0, 'p95': 20.0, 'p99': 30.0,
+            'queries_per_request': 2.0,
+        }}}
+        report = {'scenarios': {'sale-list': dict(baseline['scenarios']['sale-list'], p95=23.0)}}
+        self.assertEqual(benchmark.regressions(baseline, report, threshold=0.2), [])
+        report['scenarios']['sale-list'].update(p99=40.0, queries_per_request=3.0)
+        self.assertEqual(len(benchmark.regressions(baseline, report, threshold=0.2)), 2)
+
+
+class Collect(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((threading.current_thread().name, self.format(record)))
+
+
+class AsyncLoggingTests(SimpleTestCase):
+
+    def test_records_are_written_by_the_listener_thread(self):
+        target = Collect()
+        target.setFormatter(logs.StructuredFormatter('%(message)s'))
+        logger = logging.getLogger('inventory.tests.async')
+        logger.propagate = False
+        logger.addHandler(target)
+        self.addCleanup(logger.removeHandler, target)
+        handler, = logs.install([logger.name], maxsize=0, rate=0)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.warning('sale %s discounted', 1, extra=logs.fields(store=2))
+        logger.warning('sale line', extra=logs.sampled(product=3))
+        handler.close()
+        self.assertEqual([message for thread, message in target.records], ['sale 1 discounted store=2'])
+        self.assertNotEqual(target.records[0][0], threading.current_thread().name)
+
+    def test_full_queue_drops_records(self):
+        handler = logs.AsyncHandler([], maxsize=1)
+        handler.listener.stop()
+        handler.listener = None
+        for i in range(3):
+            handler.handle(logging.makeLogRecord({'msg': 'sale'}))
+        self.assertEqual(handler.dropped, 2)
+
+
+class SQLiteConnectionTests(SimpleTestCase):
+    databases = {'default'}
+
+    @override_settings(INVENTORY_SQLITE_PRAGMAS={'synchronous': 'off', 'busy_timeout': 1234})
+    def test_pragmas_are_set_on_new_connections(self):
+        # the in-memory test database is never reopened, replay the signal of a new connection
+        connection_created.send(sender=connection.__class__, connection=connection)
+        self.addCleanup(connection_created.send, sender=connection.__class__, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+
+class OutboxTests(InventoryTestCase):
+
+    def queue(self, products, number='1', quantity=1):
+        return self.client.post('/v1/api/sale/', {
+            'number': number,
+            'store': self.store.id,
+            'details': [{'product_id': product.id, 'quantity': quantity} for product in products]
+        }, format='json', HTTP_PREFER='respond-async')
+
+    def test_sale_is_queued_and_recorded_by_the_worker(self):
+        products = self.stock(2, available=5)
+        response = self.queue(products)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], SaleOutbox.PENDING)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(self.queue(products).data['ticket'], response.data['ticket'])
+        self.queue(products, number='2', quantity=3)
+        self.queue(products, number='3', quantity=3)
+
+        entries = outbox.process_batch(10)
+        self.assertEqual([entry.status for entry in entries], ['created', 'created', 'rejected'])
+        self.assertEqual(list(Inventory.objects.values_list('available', flat=True)), [1, 1])
+        ticket = self.client.get(response['Location'])
+        self.assertEqual(ticket.data['status'], 'created')
+        self.assertEqual(ticket.data['sale'], Sale.objects.get(number='1').id)
+        rejected = self.client.get(f'/v1/api/sale-ticket/{entries[2].ticket}/')
+        self.assertEqual(rejected.json()['errors']['details'][0]['available'], 1)
+        self.assertEqual(outbox.process_batch(10), [])
+        self.client.logout()
+        self.assertEqual(self.client.get(response['Location']).status_code, 403)
+
+    def test_invalid_sale_is_not_queued(self):
+        response = self.client.post('/v1/api/sale/', {'number': '1', 'store': self.store.id, 'details': []},
+                                    format='json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SaleOutbox.objects.exists())
+
+
+class LedgerTests(InventoryTestCase):
+
+    def test_sales_are_recorded_as_applied_movements(self):
+        products = self.stock(2)
+        self.sell(products, quantity=2)
+        self.client.post('/v1/api/sale/bulk/', [
+            {'number': '2', 'store': self.store.id, 'details': [{'product_id': products[0].id, 'quantity': 1}]}
+        ], format='json')
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('product_id', 'quantity', 'applied', 'sale__number')),
+            [(products[0].id, -2, True, '1'), (products[1].id, -2, True, '1'), (products[0].id, -1, True, '2')]
+        )
+        response = self.client.get(f'/v1/api/stock-movement/?product={products[0].id}')
+        self.assertEqual([row['quantity'] for row in response.data['results']], [-1, -2])
+
+    @override_settings(INVENTORY_STOCK_DEFERRED=True)
+    def test_deferred_sales_leave_inventory_until_compaction(self):
+        products = self.stock(1, available=5)
+        self.sell(products, quantity=2, number='1')
+        self.sell(products, quantity=2, number='2')
+        self.assertEqual(self.sell(products, quantity=2, number='3').status_code, 400)
+        self.assertEqual(Inventory.objects.get().available, 5)
+        row, = self.client.get('/v1/api/inventory/stock/').data['results']
+        self.assertEqual((row['available'], row['pending'], row['stock']), (5, -4, 1))
+
+        self.assertEqual(ledger.compact(), 2)
+        self.assertEqual(Inventory.objects.get().available, 1)
+        self.assertFalse(StockMovement.objects.filter(applied=False).exists())
+        self.assertEqual(ledger.compact(), 0)
+        row, = self.client.get('/v1/api/inventory/stock/').data['results']
+        self.assertEqual((row['available'], row['pending'], row['stock']), (1, 0, 1))
+
+    @override_settings(INVENTORY_STOCK_DEFERRED=True)
+    def test_compaction_leaves_rows_without_movements(self):
+        sold, untouched = self.stock(2, available=5)
+        self.sell([sold], quantity=2)
+        self.assertEqual(ledger.compact(), 1)
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)), [3, 5]
+        )
+
+
+class StockTransferTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.target = Store.objects.create(name='Norte')
+
+    def transfer(self, items):
+        return self.client.post('/v1/api/stock-transfer/', {
+            'source': self.store.id,
+            'target': self.target.id,
+            'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in items]
+        }, format='json')
+
+    def test_transfer_moves_stock_and_creates_rows(self):
+        products = self.stock(2, available=10)
+        Inventory.objects.create(store=self.target, product=products[0], available=1)
+        response = self.transfer([(products[0], 4), (products[1], 3), (products[0], 1)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['lines'], response.data['units']), (2, 8))
+        self.assertEqual({(row.store_id, row.product_id): row.available for row in Inventory.objects.all()}, {
+            (self.store.id, products[0].id): 5, (self.store.id, products[1].id): 7,
+            (self.target.id, products[0].id): 6, (self.target.id, products[1].id): 3,
+        })
+        movements = self.client.get(f'/v1/api/stock-movement/?transfer={response.data["id"]}').data['results']
+        self.assertEqual(sorted((row['store'], row['quantity']) for row in movements), [
+            (self.store.id, -5), (self.store.id, -3), (self.target.id, 3), (self.target.id, 5)
+        ])
+
+    def test_short_transfer_is_rolled_back(self):
+        products = self.stock(2, available=2)
+        response = self.transfer([(products[0], 1), (products[1], 3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(line['product_id'], line['available']) for line in response.json()['items']],
+                         [(products[1].id, 2)])
+        self.assertEqual(list(Inventory.objects.values_list('available', flat=True)), [2, 2])
+        self.assertFalse(StockTransfer.objects.exists())
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(self.client.post('/v1/api/stock-transfer/', {
+            'source': self.store.id, 'target': self.store.id, 'items': [{'product_id': products[0].id, 'quantity': 1}]
+        }, format='json').status_code, 400)
+
+    def test_query_count_does_not_depend_on_lines(self):
+        products = self.stock(100)
+        with CaptureQueriesContext(connection) as small:
+            self.transfer([(product, 1) for product in products[:2]])
+        with self.assertNumQueries(len(small)):
+            self.assertEqual(self.transfer([(product, 1) for product in products]).status_code, 201)
+
+    @override_settings(INVENTORY_STOCK_DEFERRED=True)
+    def test_deferred_transfer_is_compacted(self):
+        products = self.stock(1, available=5)
+        self.assertEqual(self.transfer([(products[0], 2)]).status_code, 201)
+        self.assertEqual(self.transfer([(products[0], 4)]).status_code, 400)
+        self.assertEqual(ledger.compact(), 2)
+        self.assertEqual(dict(Inventory.objects.values_list('store_id', 'available')),
+                         {self.store.id: 3, self.target.id: 2})
+
+
+class ReceivingTests(InventoryTestCase):
+
+    def test_receipts_and_counts_are_upserted(self):
+        products = self.stock(2, available=10)
+        other = Store.objects.create(name='Norte')
+        response = self.client.post('/v1/api/inventory/receive/', [
+            {'store': self.store.id, 'product': products[0].id, 'quantity': 5},
+            {'store': self.store.id, 'product': products[1].id, 'available': 4},
+            {'store': other.id, 'product': products[0].id, 'quantity': 3},
+            {'store': self.store.id, 'product': products[0].id, 'quantity': -20},
+            {'store': self.store.id, 'product': 0, 'quantity': 1},
+            {'store': self.store.id, 'product': products[0].id, 'quantity': 1, 'available': 1},
+        ], format='json')
+        self.assertEqual([(row['status'], row.get('available')) for row in response.data], [
+            ('received', 15), ('adjusted', 4), ('received', 3), ('rejected', 15), ('rejected', None), ('rejected', None)
+        ])
+        self.assertEqual({(row.store_id, row.product_id): row.available for row in Inventory.objects.all()}, {
+            (self.store.id, products[0].id): 15, (self.store.id, products[1].id): 4, (other.id, products[0].id): 3,
+        })
+        self.assertEqual(sorted(StockMovement.objects.values_list('kind', 'quantity')), [
+            ('adjustment', -6), ('receipt', 3), ('receipt', 5)
+        ])
+
+    def test_counts_are_bounded_by_the_column(self):
+        product, = self.stock(1, available=10)
+        response = self.client.post('/v1/api/inventory/receive/', [
+            {'store': self.store.id, 'product': product.id, 'quantity': 10 ** 30},
+            {'store': self.store.id, 'product': product.id, 'quantity': -10 ** 30},
+            {'store': self.store.id, 'product': product.id, 'available': 2147483648},
+            {'store': self.store.id, 'product': product.id, 'quantity': 2147483647},
+            {'store': self.store.id, 'product': product.id, 'available': 2147483647},
+        ], format='json')
+        self.assertEqual([(row['status'], list(row.get('errors', ()))) for row in response.data], [
+            ('rejected', ['quantity']), ('rejected', ['quantity']), ('rejected', ['available']),
+            ('rejected', ['quantity']), ('adjusted', []),
+        ])
+        self.assertEqual(Inventory.objects.get().available, 2147483647)
+
+    def test_receipts_require_a_list(self):
+        for body in ('{"store": 1}', '"1"', '1', 'null'):
+            response = self.client.post('/v1/api/inventory/receive/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('non_field_errors', response.data)
+
+    def test_query_count_does_not_depend_on_items(self):
+        products = self.stock(200)
+        counts = [{'store': self.store.id, 'product': product.id, 'quantity': 1} for product in products]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/v1/api/inventory/receive/', counts[:2], format='json')
+        catalog.clear()
+        with self.assertNumQueries(len(small)):
+            response = self.client.post('/v1/api/inventory/receive/', counts, format='json')
+        self.assertEqual([row['available'] for row in response.data], [102] * 2 + [101] * 198)
+
+
+class ConcurrentReceivingTests(InventoryTestMixin, APITransactionTestCase):
+
+    def test_concurrent_counts_wait_for_the_write_lock(self):
+        products = self.stock(3, available=0)
+        errors = []
+
+        def receive(worker):
+            try:
+                for i in range(20):
+                    results = receiving.apply_counts([
+                        {'store': self.store.id, 'product': product.id, 'quantity': 1} for product in products
+                    ])
+                    self.assertEqual({result['status'] for result in results}, {receiving.RECEIVED})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=receive, args=(worker,)) for worker in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(Inventory.objects.order_by('product_id').values_list('available', flat=True)), [120] * 3
+        )
+        self.assertEqual(StockMovement.objects.count(), 360)
+
+
+class AdminTests(InventoryTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_changelists_join_related_rows(self):
+        products = self.stock(2)
+        self.sell(products)
+        for url in ('/admin/inventory/inventory/', '/admin/inventory/saledetail/', '/admin/inventory/sale/'):
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(url)
+            expected = len(small)
+            self.sell(self.stock(20), number=url)
+            with self.assertNumQueries(expected):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(INVENTORY_ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_unfiltered_changelist_is_not_counted(self):
+        self.stock(3)
+        Inventory.objects.order_by('id')[1].delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/inventory/inventory/')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries))
+        # the estimate is the id range on SQLite
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get('/admin/inventory/inventory/?available=100')
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_search_uses_name_index_and_bill_number(self):
+        products = self.stock(3)
+        Product.objects.filter(id=products[1].id).update(name='Coca Cola')
+        self.sell(products[:1], number='77')
+        response = self.client.get('/admin/inventory/inventory/', {'q': 'coca'})
+        self.assertEqual([row.product_id for row in response.context['cl'].result_list], [products[1].id])
+        response = self.client.get('/admin/inventory/saledetail/', {'q': '77'})
+        self.assertEqual([row.product_id for row in response.context['cl'].result_list], [products[0].id])
+
+
+class SearchTests(InventoryTestCase):
+
+    def names(self, url):
+        return [row['name'] for row in self.client.get(url).data['results']]
+
+    def test_products_match_word_prefixes_by_relevance(self):
+        for name in ['Coca Cola 2L', 'Chocolate', 'Limonada de coco', 'Cola']:
+            Product.objects.create(name=name, unit=Product.UNIT_UNITY, price=Decimal('1.00'))
+        self.assertEqual(self.names('/v1/api/product/?search=col'), ['Cola', 'Coca Cola 2L'])
+        self.assertEqual(self.names('/v1/api/product/?search=coc col'), ['Coca Cola 2L'])
+        self.assertEqual(self.names('/v1/api/product/?search="coc*'), ['Coca Cola 2L', 'Limonada de coco'])
+
+    def test_index_follows_edits_and_rebuilds(self):
+        store = Store.objects.create(name='Norte')
+        self.assertEqual(self.names('/v1/api/store/?search=nor'), ['Norte'])
+        store.name = 'Sur'
+        store.save()
+        self.assertEqual(self.names('/v1/api/store/?search=nor'), [])
+        Store.objects.filter(id=store.id).delete()
+        call_command('rebuild_search', stdout=io.StringIO())
+        self.assertEqual(self.names('/v1/api/store/?search=sur'), [])
+        self.assertEqual(self.names('/v1/api/store/?search=mai'), ['Main'])
+
+    def test_search_is_paged(self):
+        Product.objects.bulk_create([
+            Product(name=f'agua {i}', unit=Product.UNIT_UNITY, price=Decimal('1.00')) for i in range(5)
+        ])
+        for limit in (10, 3):
+            with self.settings(INVENTORY_SEARCH_RANK_LIMIT=limit):
+                response = self.client.get('/v1/api/product/?search=agu&page_size=2')
+                names = [row['name'] for row in response.data['results']]
+                while response.data['next']:
+                    response = self.client.get(response.data['next'])
+                    names += [row['name'] for row in response.data['results']]
+            self.assertEqual(sorted(names), [f'agua {i}' for i in range(5)])
+
+
+class SparseFieldsTests(InventoryTestCase):
+
+    def test_fields_omit_and_expand(self):
+        self.stock(1)
+        row = self.client.get('/v1/api/inventory/?fields=id,store,available').data['results'][0]
+        self.assertEqual(set(row), {'id', 'store', 'available'})
+        self.assertEqual(row['store'], self.store.id)
+        row = self.client.get('/v1/api/inventory/?fields=id,store&expand=store').data['results'][0]
+        self.assertEqual(row['store']['name'], 'Main')
+        row = self.client.get('/v1/api/product/?omit=date_lst').data['results'][0]
+        self.assertEqual(set(row), {'id', 'name', 'unit', 'price'})
+        row = self.client.get('/v1/api/inventory/').data['results'][0]
+        self.assertEqual(row['product']['name'], 'product 0')
+
+    def test_unknown_fields_are_rejected(self):
+        self.stock(1)
+        response = self.client.get('/v1/api/inventory/?fields=id,colour&omit=size')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()), ['fields', 'omit'])
+        self.assertIn('colour', response.json()['fields'][0])
+
+    def test_stock_actions_accept_sparse_fields(self):
+        self.stock(1, available=1)
+        for url in ('/v1/api/inventory/low-stock/', '/v1/api/inventory/stock/'):
+            row = self.client.get(f'{url}?fields=product,available').data['results'][0]
+            self.assertEqual(set(row), {'product', 'available'})
+
+    def test_only_rendered_columns_are_loaded(self):
+        products = self.stock(2)
+        self.sell(products)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/v1/api/sale-detail/?fields=id,quantity')
+        self.assertEqual(response.data['results'], [{'id': detail.id, 'quantity': 1}
+                                                    for detail in SaleDetail.objects.order_by('-id')])
+        sql = queries[-1]['sql']
+        self.assertIn('"quantity"', sql)
+        self.assertNotIn('"value"', sql)
+        self.assertNotIn('JOIN', sql)
+
+    def test_default_detail_list_joins_sale_and_product(self):
+        products = self.stock(10)
+        self.sell(products[:1], number='1')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/v1/api/sale-detail/')
+        expected = len(small)
+        self.sell(products, number='2')
+        with self.assertNumQueries(expected):
+            response = self.client.get('/v1/api/sale-detail/')
+        self.assertEqual(len(response.data['results']), 11)
+        self.assertEqual(response.data['results'][0]['product']['name'], 'product 9')
+
+    def test_sales_without_details_skip_the_prefetch(self):
+        products = self.stock(2)
+        self.sell(products)
+        with CaptureQueriesContext(connection) as full:
+            self.client.get('/v1/api/sale/')
+        with self.assertNumQueries(len(full) - 1):
+            response = self.client.get('/v1/api/sale/?fields=id,number,store')
+        self.assertEqual(response.data['results'], [{'id': Sale.objects.get().id, 'number': '1',
+                                                     'store': self.store.id}])
+        response = self.client.get('/v1/api/sale/?omit=store')
+        self.assertEqual(len(response.data['results'][0]['details']), 2)
+
+
+class ConcurrentArchiveTests(InventoryTestMixin, APITransactionTestCase):
+    databases = {'default', 'archive'}
+
+    def test_archiving_waits_for_the_write_lock(self):
+        products = self.stock(3, available=1000)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        errors = []
+        done = threading.Event()
+
+        def register(worker):
+            try:
+                for i in range(10):
+                    bulk.ingest_sales([
+                        {'number': f'{worker}-{i}-{n}', 'store': self.store.id,
+                         'details': [{'product_id': product.id, 'quantity': 1} for product in products]}
+                        for n in range(3)
+                    ], chunk_size=3)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        def archive_sales():
+            try:
+                while not done.wait(0.01):
+                    archive.archive_sales(tomorrow, batch_size=5)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        archiver = threading.Thread(target=archive_sales)
+        archiver.start()
+        threads = [threading.Thread(target=register, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        archiver.join()
+
+        self.assertEqual(errors, [])
+        archive.archive_sales(tomorrow, batch_size=5)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(ArchivedSale.objects.count(), 120)
+
+
+class ArchiveTests(InventoryTestCase):
+    databases = {'default', 'archive'}
+
+    def setUp(self):
+        super().setUp()
+        products = self.stock(2)
+        for number in ('1', '2', '3'):
+            self.sell(products, number=number)
+        self.old = archive.horizon() - datetime.timedelta(days=1)
+        Sale.objects.filter(number__in=['1', '2']).update(date=self.old)
+
+    def history(self, url, **params):
+        response = self.client.get(url, params)
+        return [(row['number'], row['archived']) for row in response.data['results']], response.data['next']
+
+    def test_old_sales_move_with_their_details(self):
+        output = io.StringIO()
+        call_command('archive_sales', '--batch-size', '1', stdout=output)
+        self.assertIn('2 sales archived', output.getvalue())
+        self.assertEqual(list(Sale.objects.values_list('number', flat=True)), ['3'])
+        self.assertEqual(SaleDetail.objects.count(), 2)
+        self.assertEqual(sorted(ArchivedSale.objects.values_list('number', flat=True)), ['1', '2'])
+        self.assertEqual(ArchivedSaleDetail.objects.count(), 4)
+
+        sale = ArchivedSale.objects.get(number='1')
+        self.assertEqual(StockMovement.objects.filter(sale_id=sale.id).count(), 2)
+        response = self.client.get(f'/v1/api/sale/{sale.id}/')
+        self.assertTrue(response.data['archived'])
+        self.assertEqual(len(response.data['details']), 2)
+        self.assertEqual(self.client.get('/v1/api/sale/0/').status_code, 404)
+
+    def test_rebuilt_rollups_keep_the_archived_days(self):
+        rollups.rebuild()
+        expected = list(DailySale.objects.order_by('date', 'product_id').values_list('date', 'units'))
+        call_command('archive_sales', stdout=io.StringIO())
+        rollups.rebuild()
+        self.assertEqual(list(DailySale.objects.order_by('date', 'product_id').values_list('date', 'units')), expected)
+        self.assertEqual(rollups.rebuild(date_to=self.old), 0)
+
+    def test_history_reads_the_archive_when_the_range_reaches_it(self):
+        call_command('archive_sales', stdout=io.StringIO())
+        rows, next_url = self.history('/v1/api/sale/history/', page_size=2)
+        self.assertEqual(rows, [('3', False), ('2', True)])
+        self.assertEqual(self.history(next_url), ([('1', True)], None))
+        self.assertEqual(self.history('/v1/api/sale/history/', date_to=self.old.isoformat())[0],
+                         [('2', True), ('1', True)])
+        recent = (self.old + datetime.timedelta(days=1)).isoformat()
+        # only the newest archived date is read from the archive
+        with self.assertNumQueries(1, using='archive'):
+            self.assertEqual(self.history('/v1/api/sale/history/', date_from=recent)[0], [('3', False)])
@@ -0,0 +1,38 @@
+from django.db import connection
+
+
+def insert_sql(model, columns):
+    qn = connection.ops.quote_name
+    return 'INSERT INTO {table} ({columns}) VALUES ({values})'.format(
+        table=qn(model._meta.db_table),
+        columns=', '.join(qn(column) for column in columns),
+        values=', '.join(['%s'] * len(columns))
+    )
+
+
+def upsert_sql(model, columns, conflict, update):
+    """
+    INSERT ... ON CONFLICT (conflict) DO UPDATE SET ..., supported by SQLite
+    3.24+ and PostgreSQL. `update` maps a column to the SQL expression it takes
+    on conflict, `excluded.<column>` being the value that failed to insert.
+    """
+    qn = connection.ops.quote_name
+    return 'INSERT INTO {table} ({columns}) VALUES ({values}) ON CONFLICT ({conflict}) DO UPDATE SET {update}'.format(
+        table=qn(model._meta.db_table),
+        columns=', '.join(qn(column) for column in columns),
+        values=', '.join(['%s'] * len(columns)),
+        conflict=', '.join(qn(column) for column in conflict),
+        update=', '.join(f'{qn(column)} = {expression}' for column, expression in update.items())
+    )
+
+
+def upsert(model, columns, conflict, rows, update=None):
+    """
+    Insert or update many rows with one prepared statement. Without `update`
+    every column not in `conflict` is overwritten with the new value.
+    """
+    if update is None:
+        update = {column: f'excluded.{connection.ops.quote_name(column)}'
+                  for column in columns if column not in conflict}
+    with connection.cursor() as cursor:
+        cursor.executemany(upsert_sql(model, columns, conflict, update), rows)
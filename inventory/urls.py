@@ -1,5 +1,6 @@
 from rest_framework import routers
-from .views import InventoryViewSet, ProductViewSet, StoreViewSet, SaleViewSet, SaleDetailViewSet
+from .views import InventoryViewSet, ProductViewSet, StoreViewSet, SaleViewSet, SaleDetailViewSet, DailySaleViewSet, \
+    SaleTicketViewSet, StockMovementViewSet, StockTransferViewSet
 
 router = routers.SimpleRouter()
 router.register(r'inventory', InventoryViewSet)
@@ -7,5 +8,9 @@ router.register(r'product', ProductViewSet)
 router.register(r'store', StoreViewSet)
 router.register(r'sale', SaleViewSet)
 router.register(r'sale-detail', SaleDetailViewSet)
+router.register(r'sale-ticket', SaleTicketViewSet)
+router.register(r'stock-movement', StockMovementViewSet)
+router.register(r'stock-transfer', StockTransferViewSet)
+router.register(r'report/daily-sales', DailySaleViewSet)
 
 urlpatterns = router.urls
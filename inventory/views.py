@@ -1,18 +1,86 @@
+from types import GeneratorType
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import DjangoModelPermissions
-from rest_framework import filters
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.viewsets import GenericViewSet, ModelViewSet, ReadOnlyModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Store, Product, Inventory, Sale, SaleDetail
-from .serializers import StoreSerializer, ProductSerializer, InventorySerializer, SaleSerializer, SaleDetailSerializer
+from . import archive, fieldsets, idempotency, ledger, outbox, receiving, snapshots
+from .bulk import CREATED, ingest_sales
+from .export import CONTENT_TYPES, export_lines
+from .filters import DailySaleFilter, FullTextSearchFilter
+from .models import Store, Product, Inventory, Sale, SaleDetail, DailySale, SaleOutbox, StockMovement, \
+    StockTransfer
+from .parsers import NDJSONParser
+from .serializers import StoreSerializer, ProductSerializer, InventorySerializer, InventoryFlatSerializer, \
+    SaleSerializer, SaleDetailSerializer, DailySaleSerializer, SaleTicketSerializer, StockSerializer, \
+    StockMovementSerializer, StockTransferSerializer, SaleHistorySerializer
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-class StoreViewSet(ModelViewSet):
+class ExportMixin:
+    """
+    Adds `GET <resource>/export/csv/` and `GET <resource>/export/ndjson/`,
+    streaming every row of `export_kind` filtered by `store`, `date_from` and
+    `date_to` (YYYY-MM-DD)
+    """
+    export_kind = None
+
+    @action(detail=False, methods=['get'], url_path=r'export/(?P<output>csv|ndjson)', pagination_class=None)
+    def export(self, request, output=None):
+        filters = {'store': request.query_params.get('store')}
+        if filters['store'] is not None and not filters['store'].isdigit():
+            raise ValidationError({'store': [_('a valid integer is required')]})
+        for name in ('date_from', 'date_to'):
+            value = request.query_params.get(name)
+            filters[name] = value and parse_date(value)
+            if value and filters[name] is None:
+                raise ValidationError({name: [_('a valid date is required, use YYYY-MM-DD')]})
+        response = StreamingHttpResponse(
+            export_lines(self.export_kind, output, **filters),
+            content_type=CONTENT_TYPES[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.export_kind}.{output}"'
+        return response
+
+
+class SparseQuerysetMixin:
+    """
+    Restricts the list and retrieve queryset to the fields asked with
+    `?fields=`, `?omit=` and `?expand=`. `sparse_prefetches` maps a field to
+    the prefetch it needs, dropped when the field is not rendered.
+    """
+    sparse_prefetches = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve') or fieldsets.sparse_fields(self.request) is None:
+            return queryset
+        serializer = self.get_serializer()
+        queryset = fieldsets.restrict(queryset, serializer)
+        if self.sparse_prefetches:
+            queryset = queryset.prefetch_related(None).prefetch_related(*[
+                prefetch for name, prefetch in self.sparse_prefetches.items() if name in serializer.fields
+            ])
+        return queryset
+
+
+class StoreViewSet(SparseQuerysetMixin, ModelViewSet):
     """
     Store API
     ---
@@ -20,7 +88,7 @@ class StoreViewSet(ModelViewSet):
         Return a store
 
     list:
-        Return all stores
+        Return a page of stores, `search` matches words of the name by prefix, most relevant first
 
     create:
         Create a new store
@@ -34,14 +102,14 @@ class StoreViewSet(ModelViewSet):
     queryset = Store.objects.all()
     serializer_class = StoreSerializer
     permission_classes = [DjangoModelPermissions]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [FullTextSearchFilter]
     search_fields = ['^name']
 
     def destroy(self, request, pk=None):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(SparseQuerysetMixin, ModelViewSet):
     """
     Product API
     ---
@@ -49,7 +117,7 @@ class ProductViewSet(ModelViewSet):
         Return a product
 
     list:
-        Return all products
+        Return a page of products, `search` matches words of the name by prefix, most relevant first
 
     create:
         Create a new product
@@ -63,7 +131,7 @@ class ProductViewSet(ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [DjangoModelPermissions]
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
+    filter_backends = [FullTextSearchFilter, DjangoFilterBackend]
     search_fields = ['^name']
     filterset_fields = ['price']
 
@@ -71,7 +139,7 @@ class ProductViewSet(ModelViewSet):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
-class InventoryViewSet(ReadOnlyModelViewSet):
+class InventoryViewSet(ExportMixin, SparseQuerysetMixin, ReadOnlyModelViewSet):
     """
     Inventory API
     ---
@@ -79,24 +147,139 @@ class InventoryViewSet(ReadOnlyModelViewSet):
         Return a inventory
 
     list:
-        Return all inventories
+        Return a page of inventories, `?flat=true` returns store and product
+        names instead of the nested objects; `?fields=`, `?omit=` and
+        `?expand=` pick the fields
+
+    export:
+        Stream all inventories as CSV or NDJSON
+
+    low_stock:
+        Return a page of inventories to reorder
+
+    stock:
+        Return a page of current stock, the inventory plus the movements not compacted yet
+
+    receive:
+        Apply stock receipts and counts of many rows in one transaction
     """
-    queryset = Inventory.objects.all()
+    queryset = Inventory.objects.select_related('store', 'product')
     serializer_class = InventorySerializer
     permission_classes = [DjangoModelPermissions]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['store', 'product']
+    export_kind = 'inventory'
 
+    def list(self, request, *args, **kwargs):
+        """
+        Store snapshots (`?store=N`) are cached until a sale or an edit
+        touches the store and answer conditional requests with 304
+        """
+        store = request.query_params.get('store', '')
+        if not store.isdigit():
+            return super().list(request, *args, **kwargs)
+
+        key = snapshots.snapshot_key(store, request)
+        snapshot = snapshots.cache().get(key)
+        if snapshot is None:
+            etag, last_modified = snapshots.validators(store, request)
+            snapshot = {'etag': etag, 'last_modified': last_modified}
+            not_modified = snapshots.not_modified(request, snapshot)
+            if not_modified is not None:
+                return snapshots.set_validators(not_modified, snapshot)
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            snapshot['data'] = response.data
+            snapshots.cache().set(key, snapshot, settings.INVENTORY_SNAPSHOT_TIMEOUT)
+        else:
+            not_modified = snapshots.not_modified(request, snapshot)
+            if not_modified is not None:
+                return snapshots.set_validators(not_modified, snapshot)
+            response = Response(snapshot['data'])
+        return snapshots.set_validators(response, snapshot)
+
+    @action(detail=False, methods=['get'], url_path='low-stock')
+    def low_stock(self, request):
+        """
+        Return a page of inventories at or below their reorder point, or at
+        or below `threshold` (default INVENTORY_LOW_STOCK_THRESHOLD) when they
+        have none, optionally for one `store`
+        """
+        params = {'threshold': settings.INVENTORY_LOW_STOCK_THRESHOLD, 'store': None}
+        for name in params:
+            value = request.query_params.get(name)
+            try:
+                params[name] = int(value) if value is not None else params[name]
+            except ValueError:
+                raise ValidationError({name: [_('a valid integer is required')]})
+        rows = ledger.low_stock(params['threshold'], params['store']).select_related('store', 'product')
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def stock(self, request):
+        """
+        Return a page of inventories with their `pending` stock movements and
+        current `stock`, filtered by `store` and `product`. Every row is read
+        with its movements in one query, so it is consistent with the sales
+        recorded so far.
+        """
+        queryset = ledger.with_stock(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
-class SaleViewSet(ModelViewSet):
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def receive(self, request):
+        """
+        Receive deliveries and apply stock counts: a JSON array (or NDJSON) of
+        items with `store`, `product` and either `quantity`, units added
+        (negative to take them out), or `available`, the units counted. Every
+        item is applied in one transaction with a constant number of queries;
+        the response has one result per item, in input order, with the stock
+        it left.
+        ---
+        [
+            {"index": 0, "store": 1, "product": 2, "status": "received", "available": 40},
+            {"index": 1, "store": 1, "product": 3, "status": "adjusted", "available": 12},
+            {"index": 2, "store": 1, "product": 9, "status": "rejected", "errors": {"product": ["product not found"]}}
+        ]
+        """
+        if not isinstance(request.data, (list, GeneratorType)):
+            raise ValidationError({'non_field_errors': [_('a list of stock counts is required')]})
+        items = list(request.data)
+        if len(items) > settings.INVENTORY_RECEIVING_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [
+                _('at most %(max)s items are accepted') % {'max': settings.INVENTORY_RECEIVING_MAX_ITEMS}
+            ]})
+        return Response(receiving.apply_counts(items))
+
+    def get_serializer_class(self):
+        if self.action == 'stock':
+            return StockSerializer
+        if self.action == 'low_stock':
+            # the deferred rows also carry their pending movements and current stock
+            return StockSerializer if settings.INVENTORY_STOCK_DEFERRED else InventoryFlatSerializer
+        if self.request.query_params.get('flat') in ('1', 'true'):
+            return InventoryFlatSerializer
+        return super().get_serializer_class()
+
+
+class SaleViewSet(ExportMixin, SparseQuerysetMixin, ModelViewSet):
     """
     Sale API
     ---
     retrieve:
-        Return a sale
+        Return a sale, from the archive when it was archived
 
     list:
-        Return all sales
+        Return a page of sales, newest first
+
+    history:
+        Return a page of sales of the default and the archive databases
+
+    export:
+        Stream all sales as CSV or NDJSON
 
     create:
         Create a new sale
@@ -107,14 +290,27 @@ class SaleViewSet(ModelViewSet):
     update:
         Update a sale
     """
-    queryset = Sale.objects.all()
+    queryset = Sale.objects.select_related('store').prefetch_related(
+        Prefetch('saledetail_set', queryset=SaleDetail.objects.order_by('id'))
+    )
     serializer_class = SaleSerializer
+    sparse_prefetches = {'details': Prefetch('saledetail_set', queryset=SaleDetail.objects.order_by('id'))}
+    cursor_ordering = '-id'
+    export_kind = 'sale'
     permission_classes = [DjangoModelPermissions]
     # filter_backends = [DjangoFilterBackend]
     # filterset_fields = ['number', 'date']
 
     def create(self, request):
         """
+        Retries are answered with the original sale and an
+        `Idempotent-Replayed: true` header when they carry the same
+        Idempotency-Key header or the same store and bill number.
+
+        With `Prefer: respond-async` (or INVENTORY_ASYNC_SALES on) a valid
+        sale is queued instead and answered with 202 and a ticket, polled at
+        `sale-ticket/<ticket>/` until the process_sales worker records it.
+
         POST Example
         {
             "number": "1",
@@ -147,11 +343,117 @@ class SaleViewSet(ModelViewSet):
           pytype: SaleDetailSerializer
         ---
         """
+        replayed = idempotency.replay(request)
+        if replayed is not None:
+            return self.replayed_response(*replayed)
+        existing = self.existing_sale(request.data)
+        if existing is not None:
+            return self.replayed_response(SaleSerializer(existing).data, status.HTTP_201_CREATED)
+
         sale_serializer = SaleSerializer(data=request.data)
         sale_serializer.is_valid(raise_exception=True)
-        # logger.info(f"serializer {serial}")
-        sale = sale_serializer.create(sale_serializer.validated_data)
-        return Response(sale, status=status.HTTP_201_CREATED)
+        if outbox.accepts_async(request, settings.INVENTORY_ASYNC_SALES):
+            return self.enqueue(request, sale_serializer.validated_data)
+        try:
+            sale_serializer.save()
+        except IntegrityError:
+            # a concurrent retry created the same (store, number) first
+            existing = self.existing_sale(request.data)
+            if existing is None:
+                raise
+            return self.replayed_response(SaleSerializer(existing).data, status.HTTP_201_CREATED)
+        idempotency.remember(request, sale_serializer.data, status.HTTP_201_CREATED)
+        return Response(sale_serializer.data, status=status.HTTP_201_CREATED)
+
+    def enqueue(self, request, validated_data):
+        entry = outbox.pending(validated_data['store'].id, validated_data['number'])
+        replayed = entry is not None
+        if not replayed:
+            entry = outbox.enqueue(validated_data)
+        data = SaleTicketSerializer(entry).data
+        idempotency.remember(request, data, status.HTTP_202_ACCEPTED)
+        response = self.replayed_response(data, status.HTTP_202_ACCEPTED) if replayed \
+            else Response(data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('saleoutbox-detail', args=[entry.ticket], request=request)
+        return response
+
+    def existing_sale(self, data):
+        """
+        Sale already recorded with the same store and bill number, found on
+        the unique (store, number) index
+        """
+        key = idempotency.sale_key(data)
+        if key is None:
+            return None
+        return self.get_queryset().filter(store_id=key[0], number=key[1]).first()
+
+    def replayed_response(self, data, status_code):
+        response = Response(data, status=status_code)
+        response[idempotency.REPLAYED_HEADER] = 'true'
+        return response
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Create many sales in one request, either a JSON array of sales or
+        one sale per line with Content-Type application/x-ndjson. Sales are
+        committed in chunks of `chunk_size`; the response lists the result of
+        every sale in input order. Sales whose store and bill number are
+        already recorded are reported as duplicates and not created again.
+        ---
+        [
+            {"index": 0, "number": "1", "status": "created", "id": 10},
+            {"index": 1, "number": "2", "status": "rejected", "errors": {"store": ["store not found"]}},
+            {"index": 2, "number": "0", "status": "duplicate", "id": 3}
+        ]
+        """
+        if not isinstance(request.data, (list, GeneratorType)):
+            raise ValidationError({'non_field_errors': [_('a list of sales is required')]})
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', settings.INVENTORY_BULK_SALE_CHUNK_SIZE))
+        except ValueError:
+            raise ValidationError({'chunk_size': [_('a valid integer is required')]})
+        chunk_size = max(1, min(chunk_size, settings.INVENTORY_BULK_SALE_MAX_CHUNK_SIZE))
+        results = ingest_sales(request.data, chunk_size)
+        logger.info('bulk sale upload %s sales, %s created', len(results),
+                    sum(1 for result in results if result['status'] == CREATED))
+        return Response(results)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            sale = archive.archived_sale(kwargs['pk']) if str(kwargs['pk']).isdigit() else None
+            if sale is None:
+                raise
+            return Response(SaleHistorySerializer(sale).data)
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Return a page of sales, newest first, filtered by `store`, `date_from`
+        and `date_to` (YYYY-MM-DD), read from the archive database too when
+        the range reaches sales archived by archive_sales. Pages follow the
+        `next` link (`before=<id>`).
+        """
+        filters = {}
+        for name in ('store', 'before', 'page_size'):
+            value = request.query_params.get(name)
+            if value is not None and not value.isdigit():
+                raise ValidationError({name: [_('a valid integer is required')]})
+            filters[name] = int(value) if value is not None else None
+        for name in ('date_from', 'date_to'):
+            value = request.query_params.get(name)
+            filters[name] = value and parse_date(value)
+            if value and filters[name] is None:
+                raise ValidationError({name: [_('a valid date is required, use YYYY-MM-DD')]})
+        limit = min(filters.pop('page_size') or settings.REST_FRAMEWORK['PAGE_SIZE'], settings.INVENTORY_MAX_PAGE_SIZE)
+        sales = archive.history(limit=limit + 1, **filters)
+        next_url = None
+        if len(sales) > limit:
+            sales = sales[:limit]
+            next_url = replace_query_param(request.build_absolute_uri(), 'before', sales[-1].id)
+        return Response({'next': next_url, 'results': SaleHistorySerializer(sales, many=True).data})
 
     def partial_update(self, request, pk=None):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -163,7 +465,71 @@ class SaleViewSet(ModelViewSet):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
-class SaleDetailViewSet(ReadOnlyModelViewSet):
+class SaleTicketViewSet(RetrieveModelMixin, GenericViewSet):
+    """
+    Sale ticket API
+    ---
+    retrieve:
+        Return the status of a queued sale: pending, created with the sale
+        id, rejected with the errors, or duplicate of an already recorded sale
+    """
+    queryset = SaleOutbox.objects.all()
+    serializer_class = SaleTicketSerializer
+    permission_classes = [DjangoModelPermissions]
+    lookup_field = 'ticket'
+
+
+class StockMovementViewSet(ReadOnlyModelViewSet):
+    """
+    Stock movement API
+    ---
+    retrieve:
+        Return a stock movement
+
+    list:
+        Return a page of stock movements, newest first, filtered by `store`,
+        `product`, `kind`, `sale` and `transfer`
+    """
+    queryset = StockMovement.objects.all()
+    serializer_class = StockMovementSerializer
+    permission_classes = [DjangoModelPermissions]
+    filterset_fields = ['store', 'product', 'kind', 'sale', 'transfer']
+    cursor_ordering = '-id'
+
+
+class StockTransferViewSet(CreateModelMixin, ReadOnlyModelViewSet):
+    """
+    Stock transfer API
+    ---
+    retrieve:
+        Return a stock transfer, its lines are the stock movements of the transfer
+
+    list:
+        Return a page of stock transfers, newest first, filtered by `source` and `target`
+
+    create:
+        Move stock from one store to another, all lines or none
+
+        POST Example
+        {
+            "source": 1,
+            "target": 2,
+            "items": [
+                {
+                    "product_id": 1,
+                    "quantity": 10
+                }
+            ]
+        }
+    """
+    queryset = StockTransfer.objects.all()
+    serializer_class = StockTransferSerializer
+    permission_classes = [DjangoModelPermissions]
+    filterset_fields = ['source', 'target']
+    cursor_ordering = '-id'
+
+
+class SaleDetailViewSet(ExportMixin, SparseQuerysetMixin, ReadOnlyModelViewSet):
     """
     Sale detail API
     ---
@@ -171,10 +537,36 @@ class SaleDetailViewSet(ReadOnlyModelViewSet):
         Return a sale detail
 
     list:
-        Return all sale details
+        Return a page of sale details, newest first; `?fields=`, `?omit=` and
+        `?expand=` pick the fields
+
+    export:
+        Stream all sale details as CSV or NDJSON
     """
-    queryset = SaleDetail.objects.all()
+    # the nested sale and product of every row; sparse requests narrow it
+    queryset = SaleDetail.objects.select_related('sale', 'product')
     serializer_class = SaleDetailSerializer
+    cursor_ordering = '-id'
+    export_kind = 'sale-detail'
     permission_classes = [DjangoModelPermissions]
     # filter_backends = [DjangoFilterBackend]
     # filterset_fields = ['sale']
+
+
+class DailySaleViewSet(ReadOnlyModelViewSet):
+    """
+    Daily sales report API, units and value sold per store, product and day
+    ---
+    retrieve:
+        Return a daily total
+
+    list:
+        Return a page of daily totals, filtered by `store`, `product`,
+        `date_from` and `date_to` (YYYY-MM-DD)
+    """
+    queryset = DailySale.objects.all()
+    serializer_class = DailySaleSerializer
+    permission_classes = [DjangoModelPermissions]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = DailySaleFilter
+    cursor_ordering = '-id'